@@ -0,0 +1,69 @@
+# backtest/benchmarks/compare.py
+
+import argparse
+import json
+import sys
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def load_results(path):
+    with open(path) as f:
+        data = json.load(f)
+    # Files written before the schedule dimension only hold yearly runs
+    return data['meta'], {(r['scale'], r.get('schedule', 'yearly'), r['benchmark']): r for r in data['results']}
+
+
+def compare(base_path, new_path, threshold=0.2):
+    """
+    Compare two result files benchmark by benchmark.
+    Returns the (scale, schedule, benchmark) keys whose best time or peak memory grew by more than `threshold`.
+    """
+    base_meta, base = load_results(base_path)
+    new_meta, new = load_results(new_path)
+
+    table = Table(title=f"Benchmarks: {base_meta['label']} → {new_meta['label']}")
+    for col in ("Scale", "Schedule", "Benchmark", "Base s", "New s", "Time ×", "Base MiB", "New MiB", "Memory ×"):
+        table.add_column(col, justify="left" if col in ("Scale", "Schedule", "Benchmark") else "right")
+
+    regressions = []
+    for key in [k for k in new if k in base]:
+        b, n = base[key], new[key]
+        time_ratio = n['best_s'] / b['best_s'] if b['best_s'] else float('nan')
+        mem_ratio = n['peak_bytes'] / b['peak_bytes'] if b['peak_bytes'] else float('nan')
+        regressed = time_ratio > 1 + threshold or mem_ratio > 1 + threshold
+        if regressed:
+            regressions.append(key)
+
+        style = "red" if regressed else ("green" if time_ratio < 1 - threshold else None)
+        table.add_row(
+            *key,
+            f"{b['best_s']:.4f}", f"{n['best_s']:.4f}", f"{time_ratio:.2f}",
+            f"{b['peak_bytes'] / 2**20:,.1f}", f"{n['peak_bytes'] / 2**20:,.1f}", f"{mem_ratio:.2f}",
+            style=style
+        )
+    console.print(table)
+
+    if base_meta.get('platform') != new_meta.get('platform') or base_meta.get('cpu_count') != new_meta.get('cpu_count'):
+        console.print("[yellow]Results come from different machines; compare with care.[/yellow]")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base", help="Baseline result JSON")
+    parser.add_argument("new", help="New result JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative slowdown / memory growth")
+    args = parser.parse_args(argv)
+
+    regressions = compare(args.base, args.new, args.threshold)
+    if regressions:
+        console.print(f"[red]{len(regressions)} regressions over {args.threshold:.0%}[/red]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# backtest/benchmarks/run.py
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import logging
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import FREQUENCY_MONTHS, SyntheticPriceProvider, make_allocations, write_allocations
+import engine.price_cache
+from engine.data_loader import preprocess_file
+from engine.metrics import run_metrics
+from engine.report import build_drift_reports, report_yearly_purchases_with_drift
+from engine.resample import run_resampling
+from engine.simulate import prepare_allocations, simulate_from_file, end_price_frame, price_needs
+from engine.prices import PriceMatrix
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# name: (tickers per year, years)
+SCALES = {
+    'small': (50, 5),
+    'medium': (500, 10),
+    'large': (2000, 20)
+}
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+@contextmanager
+def scratch_folder():
+    """
+    Temporary folder for a benchmark run, with the engine caches pointed inside
+    it so the real cache is never touched. Both are removed on exit.
+    """
+    scratch = tempfile.mkdtemp(prefix="backtest_bench_")
+    saved = os.environ.get("BACKTEST_CACHE_DIR"), engine.price_cache.CACHE_DIR
+    cache_dir = os.path.join(scratch, "cache")
+    os.environ["BACKTEST_CACHE_DIR"] = engine.price_cache.CACHE_DIR = cache_dir
+    try:
+        yield scratch
+    finally:
+        if saved[0] is None:
+            os.environ.pop("BACKTEST_CACHE_DIR", None)
+        else:
+            os.environ["BACKTEST_CACHE_DIR"] = saved[0]
+        engine.price_cache.CACHE_DIR = saved[1]
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _reset_cache():
+    cache_dir = engine.price_cache.CACHE_DIR
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir)
+
+
+def measure(func, repeats=3, setup=None):
+    """
+    Best and mean wall time over `repeats` calls, plus peak traced memory of one
+    extra call (traced separately so tracing does not skew the timings).
+    `setup` runs untimed before every call.
+    """
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'best_s': min(times), 'mean_s': float(np.mean(times)), 'peak_bytes': peak}
+
+
+# -----------------------------
+# Benchmarks per scale
+# -----------------------------
+def bench_scale(scale, n_tickers, n_years, repeats=3, plots=False, schedule="yearly", scratch=None):
+    if scratch is None:
+        with scratch_folder() as scratch:
+            return bench_scale(scale, n_tickers, n_years, repeats, plots, schedule, scratch)
+    folder = os.path.join(scratch, f"{scale}_{schedule}")
+    os.makedirs(folder, exist_ok=True)
+    provider = SyntheticPriceProvider(seed=0, delisted_fraction=0.02)
+    df_alloc = make_allocations(n_tickers, n_years, seed=0, frequency=schedule)
+    raw_path = write_allocations(df_alloc, os.path.join(folder, "allocations.csv"))
+    rows = len(df_alloc)
+
+    results = []
+
+    def record(name, stats, n_rows=rows):
+        stats.update({'scale': scale, 'schedule': schedule, 'benchmark': name, 'tickers': n_tickers, 'years': n_years, 'rows': n_rows})
+        stats['rows_per_s'] = n_rows / stats['best_s'] if stats['best_s'] else None
+        results.append(stats)
+        print(f"  {scale:<8} {schedule:<9} {name:<36} best {stats['best_s']:8.4f}s  peak {stats['peak_bytes'] / 2**20:8.1f} MiB")
+
+    # Preprocessing: cold ingest and listing caches on every call
+    record("preprocess_file", measure(
+        lambda: preprocess_file(raw_path, "ticker", "weight", "date", provider=provider),
+        repeats, setup=_reset_cache
+    ))
+    df_clean = preprocess_file(raw_path, "ticker", "weight", "date", provider=provider)
+    clean_path = os.path.join(folder, "df_clean.csv")
+    df_clean.to_csv(clean_path, index=False)
+
+    for method in ("loop", "vectorized"):
+        record(f"simulate_from_file[{method}]", measure(
+            lambda: simulate_from_file(clean_path, 100000.0, provider=provider, method=method, schedule=schedule),
+            repeats
+        ), len(df_clean))
+
+    history_df, df_bought_year, capital_start_year, reports_by_year = simulate_from_file(
+        clean_path, 100000.0, provider=provider, method="vectorized", schedule=schedule
+    )
+
+    # Reports on a prebuilt price matrix so only report code is timed
+    df_all, years, end_dates = prepare_allocations(df_clean, schedule=schedule)
+    prices = PriceMatrix.build(price_needs(df_all, end_dates), provider)
+    end_prices = end_price_frame(prices, years, end_dates)
+
+    def per_year_reports():
+        for i, year in enumerate(years):
+            next_year = set(df_all.loc[df_all['year'] == years[i + 1], 'ticker']) if i < len(years) - 1 else set()
+            report_yearly_purchases_with_drift(df_bought_year[year], capital_start_year[year], year, end_dates[i], next_year, prices)
+
+    record("report_yearly_purchases_with_drift", measure(per_year_reports, repeats), len(df_clean))
+    record("build_drift_reports", measure(
+        lambda: build_drift_reports(df_bought_year, capital_start_year, end_prices, df_all[['year', 'ticker']]),
+        repeats
+    ), len(df_clean))
+
+    record("run_metrics[no plots]", measure(
+        lambda: run_metrics(history_df, None, reports_by_year, plots=False),
+        repeats
+    ), len(df_clean))
+    for method in ("block", "assets"):
+        record(f"run_resampling[{method} 10k]", measure(
+            lambda: run_resampling(reports_by_year, 10_000, method),
+            repeats
+        ), len(df_clean))
+    if plots:
+        session_path = os.path.join(folder, "session")
+
+        def clear_plots():
+            shutil.rmtree(session_path, ignore_errors=True)
+            os.makedirs(os.path.join(session_path, "results"))
+
+        record("run_metrics[plots]", measure(
+            lambda: run_metrics(history_df, session_path, reports_by_year, plots=True, workers=1),
+            1, setup=clear_plots
+        ), len(df_clean))
+
+    return results
+
+
+# -----------------------------
+# Results
+# -----------------------------
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(scales, repeats=3, plots=False, label=None, out_dir=RESULTS_DIR, schedules=("yearly",)):
+    """
+    Run every benchmark for each scale and rebalance schedule in the grid and
+    save a JSON result file. Returns the path of the saved file.
+    """
+    commit = _git_commit()
+    meta = {
+        'label': label or commit,
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeats': repeats
+    }
+
+    results = []
+    with scratch_folder() as scratch:
+        for scale in scales:
+            n_tickers, n_years = SCALES[scale]
+            for schedule in schedules:
+                print(f"Scale {scale}: {n_tickers} tickers x {n_years} years, rebalanced {schedule}")
+                results.extend(bench_scale(scale, n_tickers, n_years, repeats, plots, schedule, scratch))
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{meta['label']}.json")
+    with open(path, "w") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f"Benchmark results saved to: {path}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic allocations and prices.")
+    parser.add_argument("--scales", default="small,medium", help=f"Comma-separated scales from {list(SCALES)}")
+    parser.add_argument("--schedules", default="yearly", help=f"Comma-separated rebalance schedules from {list(FREQUENCY_MONTHS)}")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed calls per benchmark (best is reported)")
+    parser.add_argument("--plots", action="store_true", help="Also benchmark run_metrics with plot rendering")
+    parser.add_argument("--label", default=None, help="Result file name (default: current git commit)")
+    parser.add_argument("--out-dir", default=RESULTS_DIR, help="Folder result files are written to")
+    args = parser.parse_args(argv)
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scales: {unknown}")
+    schedules = [s.strip() for s in args.schedules.split(",") if s.strip()]
+    unknown = [s for s in schedules if s not in FREQUENCY_MONTHS]
+    if unknown:
+        parser.error(f"Unknown schedules: {unknown}")
+
+    # Per-call engine logging would dominate the timings
+    logging.getLogger("backtest").setLevel(logging.ERROR)
+    run(scales, args.repeats, args.plots, args.label, args.out_dir, schedules)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
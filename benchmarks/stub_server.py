@@ -0,0 +1,134 @@
+# backtest/benchmarks/stub_server.py
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticPriceProvider
+
+CHART_PATH = re.compile(r"^/v8/finance/chart/([^/]+)$")
+
+
+def chart_payload(provider, ticker, period1, period2):
+    """
+    Yahoo chart API response for one ticker built from a price provider.
+    """
+    start = pd.to_datetime(period1, unit='s')
+    end = pd.to_datetime(period2, unit='s')
+    closes = provider.get_history([ticker], start, end)[ticker].dropna()
+    timestamps = [int((d + pd.Timedelta(hours=13, minutes=30)).timestamp()) for d in closes.index]
+    return {'chart': {'result': [{
+        'meta': {'symbol': ticker, 'gmtoffset': 0},
+        'timestamp': timestamps,
+        'indicators': {
+            'quote': [{'close': closes.round(6).tolist()}],
+            'adjclose': [{'adjclose': closes.round(6).tolist()}]
+        }
+    }], 'error': None}}
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Yahoo chart API serving synthetic prices.
+    Requests fail with 429 with probability `fail_rate` and take `latency`
+    seconds, so retry and rate-limit behaviour can be exercised offline.
+    `unknown` tickers answer 404 and `failing` tickers always answer 503.
+    Connections are kept alive; `counts` tracks requests and connections opened.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, provider=None, fail_rate=0.0, latency=0.0, unknown=(), failing=(), seed=0):
+        super().__init__(address, _Handler)
+        self.provider = provider or SyntheticPriceProvider()
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.unknown = set(unknown)
+        self.failing = set(failing)
+        self.random = random.Random(seed)
+        self.counts = {'requests': 0, 'throttled': 0, 'connections': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests, like the real API
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.counts['connections'] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.counts['requests'] += 1
+            fail = server.random.random() < server.fail_rate
+            if fail:
+                server.counts['throttled'] += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlparse(self.path)
+        match = CHART_PATH.match(url.path)
+        if not match:
+            return self._send(404, {'error': 'unknown path'})
+        if fail:
+            return self._send(429, {'error': 'Too Many Requests'}, {'Retry-After': '0'})
+
+        ticker = match.group(1)
+        if ticker in server.failing:
+            return self._send(503, {'error': 'Service Unavailable'}, {'Retry-After': '0'})
+        if ticker in server.unknown:
+            return self._send(404, {'chart': {'result': None, 'error': {'code': 'Not Found'}}})
+
+        query = parse_qs(url.query)
+        self._send(200, chart_payload(server.provider, ticker, int(query['period1'][0]), int(query['period2'][0])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic prices through a Yahoo chart API stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args(argv)
+
+    server = StubServer((args.host, args.port), fail_rate=args.fail_rate, latency=args.latency)
+    print(f"Chart API stub listening on {server.url} (set BACKTEST_CHART_URL to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+# backtest/benchmarks/synthetic.py
+
+import zlib
+import numpy as np
+import pandas as pd
+from engine.prices import PriceProvider
+
+PRICE_ORIGIN = pd.Timestamp("2000-01-03")
+
+# Rebalance frequency: months between allocation dates (names match RebalanceSchedule kinds)
+FREQUENCY_MONTHS = {'yearly': 12, 'quarterly': 3, 'monthly': 1}
+
+
+# -----------------------------
+# Deterministic offline prices
+# -----------------------------
+class SyntheticPriceProvider(PriceProvider):
+    """
+    Offline provider with deterministic business-day closes.
+    Each ticker's log price is a drift plus two seasonal waves whose
+    parameters are seeded from the ticker name, so any date range can be
+    generated in closed form and the same (ticker, date) always has the same close.
+    A `delisted_fraction` of tickers stops trading at a seeded date.
+    """
+
+    def __init__(self, seed=0, delisted_fraction=0.0):
+        self.seed = seed
+        self.delisted_fraction = delisted_fraction
+        self._params = {}
+
+    def source_id(self):
+        return f"{type(self).__name__}:{self.seed}:{self.delisted_fraction}"
+
+    def _ticker_params(self, ticker):
+        if ticker not in self._params:
+            rng = np.random.default_rng([zlib.crc32(str(ticker).encode()), self.seed])
+            delisted = rng.random() < self.delisted_fraction
+            self._params[ticker] = (
+                rng.uniform(10, 500),           # price at origin
+                rng.normal(0.08, 0.10),         # yearly drift of log price
+                rng.uniform(0.05, 0.30, 2),     # wave amplitudes
+                rng.uniform(0.5, 4.0, 2),       # wave frequencies (cycles per year)
+                rng.uniform(0, 2 * np.pi, 2),   # wave phases
+                PRICE_ORIGIN + pd.Timedelta(days=int(rng.integers(3650, 9000))) if delisted else None
+            )
+        return self._params[ticker]
+
+    def get_history(self, tickers, start, end):
+        tickers = list(tickers)
+        dates = pd.bdate_range(pd.to_datetime(start), pd.to_datetime(end) - pd.Timedelta(days=1), name='date')
+        t = ((dates - PRICE_ORIGIN).days.to_numpy() / 365.25)[:, None]
+
+        params = [self._ticker_params(ticker) for ticker in tickers]
+        base = np.array([p[0] for p in params])
+        drift = np.array([p[1] for p in params])
+        amp, freq, phase = (np.array([p[i] for p in params]).reshape(len(tickers), 2) for i in (2, 3, 4))
+
+        log_price = drift * t
+        for k in range(2):
+            log_price = log_price + amp[:, k] * np.sin(2 * np.pi * freq[:, k] * t + phase[:, k])
+        closes = pd.DataFrame(base * np.exp(log_price), index=dates, columns=tickers)
+
+        for ticker, p in zip(tickers, params):
+            if p[5] is not None:
+                closes.loc[closes.index >= p[5], ticker] = np.nan
+        return closes
+
+
+# -----------------------------
+# Synthetic allocation files
+# -----------------------------
+def make_allocations(n_tickers, n_years, start_year=2020, universe_factor=1.5, seed=0, frequency="yearly"):
+    """
+    Allocation frame (ticker, weight, date) with `n_tickers` holdings rebalanced
+    at `frequency` (see FREQUENCY_MONTHS) from July 1st of `start_year` for
+    `n_years` years. Holdings are drawn from a universe of
+    `universe_factor * n_tickers` symbols, so some tickers are rebought and some sold.
+    """
+    if frequency not in FREQUENCY_MONTHS:
+        raise ValueError(f"Unknown frequency: {frequency} (expected one of {list(FREQUENCY_MONTHS)})")
+    rng = np.random.default_rng(seed)
+    universe = np.array([f"T{i:05d}" for i in range(max(n_tickers, int(n_tickers * universe_factor)))])
+    months = FREQUENCY_MONTHS[frequency]
+    dates = pd.date_range(f"{start_year}-07-01", periods=n_years * 12 // months, freq=f"{months}MS")
+
+    frames = []
+    for date in dates:
+        weights = rng.dirichlet(np.ones(n_tickers))
+        frames.append(pd.DataFrame({
+            'ticker': rng.choice(universe, n_tickers, replace=False),
+            'weight': weights,
+            'date': date
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_allocations(df, path):
+    """
+    Write an allocation frame as CSV (dates as YYYY-MM-DD) and return the path.
+    """
+    df.assign(date=df['date'].dt.strftime("%Y-%m-%d")).to_csv(path, index=False)
+    return path
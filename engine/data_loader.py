@@ -2,31 +2,116 @@
 
 import pandas as pd
 import os
-import yfinance as yf
-from .logger import info, warning, error
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from .logger import info, warning, error, summarize
+from .prices import PriceFetchError, get_default_provider
+from .profiler import count, profiled
+
+# A ticker counts as listed if it has any close in this many most recent days
+LISTING_WINDOW_DAYS = 7
+# Listing checks are reused for this long before a ticker is checked again
+LISTING_TTL_HOURS = 24
+LISTING_CHUNK_SIZE = 50
+LISTING_SOURCES = ("live", "store")
+
+# Bump when the loader output changes, so stale cached conversions are ignored
+INGEST_CACHE_VERSION = 1
 
 # -----------------------------
 # File Loader
 # -----------------------------
-def load_file(file_path: str) -> pd.DataFrame:
+def _clean_columns(columns):
+    return pd.Index(columns).astype(str).str.strip().str.replace("\ufeff", "", regex=False)
+
+
+def _file_hash(file_path, dtypes, parse_dates):
+    digest = hashlib.sha1(f"v{INGEST_CACHE_VERSION}|{sorted((dtypes or {}).items())}|{parse_dates}".encode())
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_csv(file_path, dtypes, parse_dates):
+    # Map cleaned names back to the raw header so dtypes apply before parsing
+    raw = pd.read_csv(file_path, nrows=0).columns
+    to_raw = dict(zip(_clean_columns(raw), raw))
+    dtype = {to_raw[c]: t for c, t in (dtypes or {}).items() if c in to_raw}
+    dates = [to_raw[c] for c in (parse_dates or []) if c in to_raw]
+
+    # One pass: the C parser already reads in blocks, and a chunked read would
+    # still hold every chunk until they are concatenated
+    return pd.read_csv(file_path, dtype=dtype, parse_dates=dates)
+
+
+def _read_excel_values(file_path):
+    # Read-only openpyxl yields plain cell values, without building the styled sheet model
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = [r for r in wb.active.iter_rows(values_only=True) if any(v is not None for v in r)]
+    finally:
+        wb.close()
+    return pd.DataFrame(rows)
+
+
+@profiled("load_file")
+def load_file(file_path: str, dtypes=None, parse_dates=None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Load CSV, Excel, Parquet or Feather/Arrow allocation files.
+    CSVs are read in one pass with explicit `dtypes`/`parse_dates` (cleaned column names);
+    .xlsx is read in read-only mode as plain values. The parsed CSV/Excel frame is cached as Parquet
+    keyed by the file's content hash, so reloading an unchanged file skips parsing.
+    """
     if not os.path.exists(file_path):
         error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
 
     ext = os.path.splitext(file_path)[1].lower()
 
+    # ---------------- Parquet / Arrow ----------------
+    if ext == ".parquet":
+        df = pd.read_parquet(file_path)
+        df.columns = _clean_columns(df.columns)
+        info(f"File loaded successfully: {file_path} ({len(df)} rows)")
+        return df
+    if ext in [".feather", ".arrow"]:
+        df = pd.read_feather(file_path)
+        df.columns = _clean_columns(df.columns)
+        info(f"File loaded successfully: {file_path} ({len(df)} rows)")
+        return df
+
+    if ext not in [".csv", ".xlsx", ".xls"]:
+        error(f"Unsupported file format: {ext}")
+        raise ValueError(f"Unsupported file format: {ext}")
+
+    # ---------------- Cached columnar conversion ----------------
+    from .price_cache import CACHE_DIR
+
+    cache_path = None
+    if use_cache:
+        cache_path = os.path.join(CACHE_DIR, "ingest", _file_hash(file_path, dtypes, parse_dates) + ".parquet")
+        if os.path.exists(cache_path):
+            df = pd.read_parquet(cache_path)
+            count("ingest_cache_hits")
+            info(f"File loaded from ingest cache: {file_path} ({len(df)} rows)")
+            return df
+
     # ---------------- CSV ----------------
     if ext == ".csv":
-        df = pd.read_csv(file_path)
+        df = _read_csv(file_path, dtypes, parse_dates)
 
     # ---------------- Excel ----------------
-    elif ext in [".xlsx", ".xls"]:
-        df = pd.read_excel(file_path, header=None)
+    else:
+        df = _read_excel_values(file_path) if ext == ".xlsx" else pd.read_excel(file_path, header=None)
 
         # Case 1: Proper multi-column Excel
         if df.shape[1] > 1:
             df.columns = df.iloc[0].astype(str).str.strip()
-            df = df.iloc[1:].reset_index(drop=True)
+            df = df.iloc[1:].reset_index(drop=True).infer_objects()
 
         # Case 2: Single-column, comma-separated
         else:
@@ -44,12 +129,25 @@ def load_file(file_path: str) -> pd.DataFrame:
             split_df.columns = split_df.iloc[0].astype(str).str.strip()
             df = split_df.iloc[1:].reset_index(drop=True)
 
-    else:
-        error(f"Unsupported file format: {ext}")
-        raise ValueError(f"Unsupported file format: {ext}")
-
     # Clean column names aggressively
-    df.columns = df.columns.astype(str).str.strip().str.replace("\ufeff", "", regex=False)
+    df.columns = _clean_columns(df.columns)
+
+    if ext != ".csv":
+        for col, t in (dtypes or {}).items():
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="raise") if t.startswith("float") else df[col].astype(t)
+        for col in parse_dates or []:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors="raise")
+
+    if cache_path:
+        count("ingest_cache_misses")
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            df.to_parquet(cache_path, index=False)
+        except Exception as e:
+            warning(f"Ingest cache not written for {file_path} ({e})")
+
     info(f"File loaded successfully: {file_path} ({len(df)} rows)")
     return df
 
@@ -57,27 +155,97 @@ def load_file(file_path: str) -> pd.DataFrame:
 # -----------------------------
 # Delisted Ticker Filter
 # -----------------------------
-def remove_delisted_tickers(df: pd.DataFrame) -> pd.DataFrame:
+def check_listing(tickers, provider=None, max_workers=8):
     """
-    Removes tickers that cannot fetch any historical data from Yahoo Finance.
+    Live listing check: a ticker is listed if it has any close in the last week.
+    Tickers are checked in chunks on a bounded thread pool, one batched request per chunk.
+    Returns {ticker: listed}; tickers whose fetch failed without any recent
+    close are left out, as their status is unknown.
     """
-    valid_tickers = []
+    provider = provider or get_default_provider()
+    today = pd.Timestamp.today().normalize()
+    chunks = [tickers[i:i + LISTING_CHUNK_SIZE] for i in range(0, len(tickers), LISTING_CHUNK_SIZE)]
 
-    for t in df['ticker'].unique():
+    def check(chunk):
+        failed = set()
         try:
-            ticker_obj = yf.Ticker(t)
-            hist = ticker_obj.history(period="1d")
-            # Must have at least one row to be valid
-            if hist.empty:
-                warning(f"Ticker removed (delisted or no data): {t}")
-            else:
-                valid_tickers.append(t)
+            recent = provider.get_history(chunk, today - timedelta(days=LISTING_WINDOW_DAYS), today)
+        except PriceFetchError as e:
+            warning("Listing check failed for %d of %d tickers (%s)", len(e.failed), len(chunk), e)
+            recent, failed = e.closes, set(e.failed)
         except Exception as e:
-            warning(f"Ticker removed (fetch error): {t} ({e})")
+            warning("Listing check failed for %d tickers (%s)", len(chunk), e)
+            return {}
+        listed = recent.reindex(columns=chunk).notna().any()
+        # A failed fetch only proves a ticker listed if some recent close still arrived
+        return {t: bool(listed[t]) for t in chunk if listed[t] or t not in failed}
+
+    status = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for result in pool.map(check, chunks):
+            status.update(result)
+    return status
+
+
+@profiled("remove_delisted_tickers")
+def remove_delisted_tickers(
+    df: pd.DataFrame,
+    provider=None,
+    source: str = "live",
+    max_workers: int = 8,
+    ttl_hours: float = LISTING_TTL_HOURS,
+    cache=None
+) -> pd.DataFrame:
+    """
+    Removes tickers that cannot fetch any recent historical data.
+    source="live" checks recent closes concurrently and caches each ticker's
+    listing status for `ttl_hours`; source="store" keeps tickers that have
+    prices in the local price store (the provider's cache, or the file of a
+    LocalPriceProvider) and makes no requests. Raises ValueError when the
+    store holds prices for none of the tickers.
+    """
+    if source not in LISTING_SOURCES:
+        raise ValueError(f"Unknown listing source: {source} (expected one of {LISTING_SOURCES})")
+
+    from .price_cache import PriceCache
+
+    provider = provider or get_default_provider()
+    tickers = list(df['ticker'].unique())
+
+    if source == "store":
+        store = cache or getattr(provider, 'cache', None) or (provider if hasattr(provider, 'stored_tickers') else None)
+        if store is None:
+            raise ValueError(f"Listing source 'store' needs a cached or local price provider, got {type(provider).__name__}")
+        stored = store.stored_tickers(tickers)
+        if tickers and not stored:
+            raise ValueError(f"None of the {len(tickers)} tickers has prices in the price store; "
+                             f"fill it first or use the 'live' listing source")
+        status = {t: t in stored for t in tickers}
+    else:
+        cache = cache or getattr(provider, 'cache', None) or PriceCache()
+        status = cache.get_listing(tickers, ttl_hours * 3600)
+        unchecked = [t for t in tickers if t not in status]
+        if unchecked:
+            checked = check_listing(unchecked, provider, max_workers)
+            cache.set_listing(checked)
+            status.update(checked)
+        info("Listing status: %d cached, %d checked live", len(tickers) - len(unchecked), len(unchecked))
+
+        # Not cached and not treated as delisted: they are checked again next time
+        unknown = [t for t in tickers if t not in status]
+        if unknown:
+            warning("Listing status unknown for %s (fetch failed); keeping them", summarize(unknown), event="listing_unknown", tickers=unknown)
+            status.update((t, True) for t in unknown)
+
+    # Must have at least one row to be valid
+    valid_tickers = [t for t in tickers if status.get(t, False)]
+    removed = [t for t in tickers if not status.get(t, False)]
+    if removed:
+        warning("Tickers removed (delisted or no data): %s", summarize(removed), event="delisted", tickers=removed)
 
     # Filter original dataframe
     df_filtered = df[df['ticker'].isin(valid_tickers)].reset_index(drop=True)
-    info(f"Delisted tickers removed. {len(df_filtered)} valid rows remain.")
+    info("Delisted tickers removed. %d valid rows remain.", len(df_filtered))
     return df_filtered
 
 # -----------------------------
@@ -88,9 +256,15 @@ def preprocess_file(
     ticker_col: str,
     weight_col: str,
     date_col: str,
-    skip_delisted_check: bool = False
+    skip_delisted_check: bool = False,
+    provider=None,
+    listing_source: str = "live"
 ) -> pd.DataFrame:
-    df = load_file(file_path)
+    df = load_file(
+        file_path,
+        dtypes={ticker_col: "category", weight_col: "float64"},
+        parse_dates=[date_col]
+    )
 
     # Validate required columns
     missing = [c for c in [ticker_col, weight_col, date_col] if c not in df.columns]
@@ -111,7 +285,7 @@ def preprocess_file(
 
     # Remove delisted tickers before further processing
     if not skip_delisted_check:
-        df = remove_delisted_tickers(df)
+        df = remove_delisted_tickers(df, provider, source=listing_source)
 
     # Normalize weights per date
     df["weight"] = df["weight"] / df.groupby("date")["weight"].transform("sum")
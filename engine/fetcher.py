@@ -0,0 +1,249 @@
+# backtest/engine/fetcher.py
+
+import asyncio
+import atexit
+import os
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.prices import PriceProvider, PriceFetchError
+from engine.profiler import count
+
+YAHOO_CHART_URL = os.environ.get("BACKTEST_CHART_URL", "https://query1.finance.yahoo.com")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) backtest"}
+
+
+class FetchError(Exception):
+    """
+    A request that failed for good (non-retryable status or retries exhausted).
+    """
+
+
+# -----------------------------
+# Rate limiting
+# -----------------------------
+class TokenBucket:
+    """
+    Token bucket for asyncio: `rate` tokens per second, bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# -----------------------------
+# Async fetcher
+# -----------------------------
+class AsyncFetcher:
+    """
+    Fetches Yahoo chart data with at most `max_in_flight` concurrent requests,
+    at most `rate` requests per second, and exponential backoff with jitter
+    on throttling, server errors and timeouts.
+
+    The fetcher owns a background event loop with one pooled aiohttp session,
+    so connections are reused across calls and the limits hold across threads.
+    `base_url` can point at a local stub server.
+    """
+
+    def __init__(
+        self,
+        base_url=YAHOO_CHART_URL,
+        max_in_flight=8,
+        rate=5.0,
+        burst=None,
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        timeout=30.0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0}
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._semaphore = None
+        self._bucket = None
+
+    # ---------------- Event loop & session ----------------
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="price-fetcher", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        return self._loop
+
+    def run(self, coro):
+        """
+        Run a coroutine on the fetcher's loop from synchronous code (any thread).
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def _session(self):
+        if self._http is None or self._http.closed:
+            try:
+                import aiohttp
+            except ImportError:
+                raise ImportError("The async fetcher needs aiohttp (pip install aiohttp).")
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=DEFAULT_HEADERS
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._bucket = TokenBucket(self.rate, self.burst)
+        return self._http
+
+    def close(self):
+        """
+        Close the HTTP session and stop the background loop.
+        """
+        if self._loop is None:
+            return
+        atexit.unregister(self.close)
+        if self._http is not None:
+            self.run(self._http.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = self._http = None
+
+    # ---------------- Requests ----------------
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * (0.5 + random.random())
+
+    async def get_json(self, path, params=None):
+        """
+        GET base_url + path and return the decoded JSON, or None on 404.
+        """
+        session = await self._session()
+        # Imported after the session, which reports a missing aiohttp first
+        import aiohttp
+
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._semaphore:
+                await self._bucket.acquire()
+                self.stats['requests'] += 1
+                count("network_requests")
+                try:
+                    async with session.get(url, params=params) as response:
+                        if response.status == 404:
+                            return None
+                        if response.status not in RETRY_STATUSES:
+                            if response.status >= 400:
+                                raise FetchError(f"HTTP {response.status} for {url}")
+                            return await response.json(content_type=None)
+                        retry_after = response.headers.get("Retry-After")
+                        reason = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    reason = type(e).__name__
+
+            if attempt == self.max_retries:
+                break
+            self.stats['retries'] += 1
+            count("fetch_retries")
+            delay = self._backoff(attempt, retry_after)
+            logger.debug("Retrying %s in %.2fs (%s)", url, delay, reason)
+            await asyncio.sleep(delay)
+
+        self.stats['failures'] += 1
+        raise FetchError(f"{reason} for {url} after {self.max_retries + 1} attempts")
+
+    async def fetch_chart(self, ticker, start, end):
+        """
+        Daily adjusted closes of one ticker in [start, end) as a Series indexed by date.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        data = await self.get_json(f"/v8/finance/chart/{ticker}", {
+            'period1': int(start.timestamp()),
+            'period2': int(end.timestamp()),
+            'interval': '1d',
+            'events': 'div,split'
+        })
+        result = ((data or {}).get('chart') or {}).get('result') or []
+        if not result or not result[0].get('timestamp'):
+            return pd.Series(dtype=float, name=ticker)
+
+        chart = result[0]
+        indicators = chart.get('indicators', {})
+        closes = (indicators.get('adjclose') or [{}])[0].get('adjclose') or indicators['quote'][0]['close']
+        offset = chart.get('meta', {}).get('gmtoffset') or 0
+        dates = pd.to_datetime(np.asarray(chart['timestamp']) + offset, unit='s').normalize()
+        series = pd.Series(np.asarray(closes, dtype=float), index=dates, name=ticker)
+        series = series[~series.index.duplicated(keep='last')]
+        return series[(series.index >= start) & (series.index < end)]
+
+    async def fetch_many(self, tickers, start, end):
+        """
+        Fetch every ticker concurrently. Returns ({ticker: Series}, {ticker: error}).
+        """
+        results = await asyncio.gather(*(self.fetch_chart(t, start, end) for t in tickers), return_exceptions=True)
+        fetched, failed = {}, {}
+        for ticker, result in zip(tickers, results):
+            if isinstance(result, BaseException):
+                failed[ticker] = result
+            else:
+                fetched[ticker] = result
+        return fetched, failed
+
+
+# -----------------------------
+# Provider
+# -----------------------------
+class YahooChartPriceProvider(PriceProvider):
+    """
+    Yahoo Finance chart API through an AsyncFetcher: one request per ticker,
+    run concurrently under the fetcher's concurrency, rate and retry limits.
+    Raises PriceFetchError (carrying the partial result) when some tickers fail for good.
+    """
+
+    def __init__(self, fetcher=None, **fetcher_kwargs):
+        self.fetcher = fetcher or AsyncFetcher(**fetcher_kwargs)
+
+    def get_history(self, tickers, start, end):
+        tickers = list(tickers)
+        fetched, failed = self.fetcher.run(self.fetcher.fetch_many(tickers, start, end))
+
+        closes = pd.concat(fetched.values(), axis=1) if fetched else pd.DataFrame(dtype=float)
+        closes = closes.reindex(columns=tickers).astype(float).sort_index()
+        closes.index.name = 'date'
+        if failed:
+            first = next(iter(failed.values()))
+            raise PriceFetchError(f"{len(failed)} tickers failed ({first})", closes, list(failed))
+        return closes
@@ -1,55 +1,160 @@
 # backtest/engine/logger.py
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
 
-LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
-
+# Overridable from the environment
+LOG_DIR = os.environ.get("BACKTEST_LOG_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 LOG_FILE = os.path.join(LOG_DIR, "backtest.log")
+LOG_LEVEL = os.environ.get("BACKTEST_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("BACKTEST_LOG_FORMAT", "text")          # "text" or "json"
+LOG_MAX_BYTES = int(os.environ.get("BACKTEST_LOG_MAX_BYTES", 10 * 2**20))
+LOG_BACKUPS = int(os.environ.get("BACKTEST_LOG_BACKUPS", 5))
+
+# Lists longer than this are shortened in messages (see summarize)
+SUMMARY_LIMIT = 10
+
+_listener = None
+_setup_lock = threading.RLock()
+
+
+# -----------------------------
+# Formatting
+# -----------------------------
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON event per line: time, level, logger, message, plus any
+    structured fields passed as keyword arguments to info/warning/error.
+    """
+
+    def format(self, record):
+        event = {
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        event.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+def summarize(items, limit=SUMMARY_LIMIT):
+    """
+    "3 (A, B, C)" or "37 (A, B, ... +27 more)" for per-ticker messages.
+    """
+    items = list(items)
+    shown = ", ".join(map(str, items[:limit]))
+    more = f", ... +{len(items) - limit} more" if len(items) > limit else ""
+    return f"{len(items)} ({shown}{more})"
+
+
+class Amount:
+    """
+    Log argument rendered as 1,234.56 only if the record is emitted.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return f"{self.value:,.2f}"
+
+
+# -----------------------------
+# Setup
+# -----------------------------
+_handlers = None      # (file, console) once set up
+_forked = False       # True in forked worker processes
 
-def setup_logger():
+
+class _SetupOnFirstRecord(logging.Handler):
+    # Placeholder until the first record: importing the engine creates no
+    # folders, files or threads, and the real handlers appear on first use
+    def emit(self, record):
+        setup_logger().handle(record)
+
+
+def _after_fork_in_child():
+    # Forked workers have no listener thread: write synchronously there
+    global _forked
+    _forked = True
+    if _handlers is not None:
+        logging.getLogger("backtest").handlers = list(_handlers)
+
+
+def setup_logger(level=None, json_format=None, max_bytes=None, backup_count=None):
     """
     Initialize and return a singleton logger instance.
+    Records go through a queue to a background listener that writes the
+    rotating log file and the console, so logging never blocks on I/O.
     """
+    global _handlers, _listener
     logger = logging.getLogger("backtest")
-    logger.setLevel(logging.INFO)
-
-    if logger.handlers:
-        return logger  # Already initialized
-
-    # File handler
-    file_handler = logging.FileHandler(LOG_FILE)
-    file_handler.setLevel(logging.INFO)
-    file_formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(message)s"
-    )
-    file_handler.setFormatter(file_formatter)
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter(
-        "[%(levelname)s] %(message)s"
-    )
-    console_handler.setFormatter(console_formatter)
-
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
+    if level:
+        logger.setLevel(level)
+
+    with _setup_lock:
+        if _handlers is not None:
+            return logger  # Already initialized
+
+        os.makedirs(LOG_DIR, exist_ok=True)
+
+        # File handler, rotated by size
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=max_bytes or LOG_MAX_BYTES,
+            backupCount=LOG_BACKUPS if backup_count is None else backup_count
+        )
+        use_json = (LOG_FORMAT == "json") if json_format is None else json_format
+        file_handler.setFormatter(JsonFormatter() if use_json else logging.Formatter(
+            "%(asctime)s [%(levelname)s] %(message)s"
+        ))
+
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(
+            "[%(levelname)s] %(message)s"
+        ))
+
+        _handlers = (file_handler, console_handler)
+        if _forked:
+            logger.handlers = list(_handlers)
+            return logger
+
+        log_queue = queue.SimpleQueue()
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        _listener = logging.handlers.QueueListener(log_queue, *_handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
     return logger
 
 
-# Initialize logger at import time
-logger = setup_logger()
-
+# Level and placeholder only; handlers are attached by the first record
+logger = logging.getLogger("backtest")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+if not logger.handlers:
+    logger.addHandler(_SetupOnFirstRecord())
+os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
-def info(msg):
-    logger.info(msg)
+# -----------------------------
+# Helpers (lazy %-style formatting; keyword arguments become JSON fields)
+# -----------------------------
+def info(msg, *args, **fields):
+    logger.info(msg, *args, extra={'fields': fields})
 
-def warning(msg):
-    logger.warning(msg)
+def warning(msg, *args, **fields):
+    logger.warning(msg, *args, extra={'fields': fields})
 
-def error(msg):
-    logger.error(msg)
+def error(msg, *args, **fields):
+    logger.error(msg, *args, extra={'fields': fields})
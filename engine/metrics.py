@@ -2,41 +2,67 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Patch
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
 from engine.logger import logger
+from engine.profiler import profiled
 import os
 
+PLOT_HASH_FILE = ".plot_hashes.json"
+
+REBALANCE_LEGEND = [
+    ('green', 'Rebought'),
+    ('red', 'Sold'),
+    ('gray', 'No Rebalance')
+]
+
+def _new_figure(figsize):
+    # Object-oriented Agg figure: no pyplot global state, safe in worker processes.
+    # matplotlib is only imported once a plot is drawn.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _legend_handles():
+    from matplotlib.patches import Patch
+
+    return [Patch(facecolor=c, edgecolor='black', label=label) for c, label in REBALANCE_LEGEND]
+
+
 # -----------------------------
 # Portfolio Weight Change Bar
 # -----------------------------
 def plot_weight_change_bar(df_report, year, out_folder):
-    df = df_report.copy().sort_values('Weight Change')
+    df = df_report.sort_values('Weight Change')
     color_map = {'Rebought': 'green', 'Sold': 'red'}
     colors = df['Action at Rebalance'].map(color_map).fillna('gray')
 
-    plt.figure(figsize=(10,6))
-    bars = plt.bar(df['Ticker'], df['Weight Change'], color=colors, edgecolor='black', alpha=0.8)
-    plt.axhline(0, color='black', linestyle='--')
-    plt.xlabel("Asset")
-    plt.ylabel("Weight Change (After 1Y − At Buy)")
-    plt.title(f"Portfolio Weight Drift — Year {year}")
-    plt.xticks(rotation=45, ha='right')
-    plt.legend(handles=[Patch(facecolor='green', edgecolor='black', label='Rebought'),
-                        Patch(facecolor='red', edgecolor='black', label='Sold'),
-                        Patch(facecolor='gray', edgecolor='black', label='No Rebalance')])
+    fig, ax = _new_figure((10,6))
+    bars = ax.bar(df['Ticker'], df['Weight Change'], color=colors, edgecolor='black', alpha=0.8)
+    ax.axhline(0, color='black', linestyle='--')
+    ax.set_xlabel("Asset")
+    ax.set_ylabel("Weight Change (After 1Y − At Buy)")
+    ax.set_title(f"Portfolio Weight Drift — Year {year}")
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.legend(handles=_legend_handles())
 
     for bar in bars:
         h = bar.get_height()
         if abs(h) > 0.005:
-            plt.text(bar.get_x() + bar.get_width()/2, h,
-                     f"{h:+.3f}", ha='center',
-                     va='bottom' if h>0 else 'top', fontsize=9)
+            ax.text(bar.get_x() + bar.get_width()/2, h,
+                    f"{h:+.3f}", ha='center',
+                    va='bottom' if h>0 else 'top', fontsize=9)
 
-    plt.tight_layout()
+    fig.tight_layout()
     file_path = os.path.join(out_folder, f"weight_change_{year}.png")
-    plt.savefig(file_path)
-    plt.close()
+    fig.savefig(file_path)
     logger.info(f"Weight change bar saved: {file_path}")
     return file_path
 
@@ -51,20 +77,19 @@ def plot_price_change_bar(df_report, year, out_folder):
     color_map = {'Rebought': 'green', 'Sold': 'red'}
     colors = df['Action at Rebalance'].map(color_map).fillna('gray')
 
-    plt.figure(figsize=(12,6))
-    plt.bar(df['Ticker'], df['Price Change'], color=colors, edgecolor='black', alpha=0.8)
-    plt.axhline(0, color='black', linestyle='--')
-    plt.xlabel("Asset")
-    plt.ylabel("Price Change (After 1Y − Buy)")
-    plt.title(f"Asset Price Change — Year {year}")
-    plt.xticks(rotation=45, ha='right')
-    plt.legend(handles=[Patch(facecolor='green', edgecolor='black', label='Rebought'),
-                        Patch(facecolor='red', edgecolor='black', label='Sold'),
-                        Patch(facecolor='gray', edgecolor='black', label='No Rebalance')])
-    plt.tight_layout()
+    fig, ax = _new_figure((12,6))
+    ax.bar(df['Ticker'], df['Price Change'], color=colors, edgecolor='black', alpha=0.8)
+    ax.axhline(0, color='black', linestyle='--')
+    ax.set_xlabel("Asset")
+    ax.set_ylabel("Price Change (After 1Y − Buy)")
+    ax.set_title(f"Asset Price Change — Year {year}")
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.legend(handles=_legend_handles())
+    fig.tight_layout()
     file_path = os.path.join(out_folder, f"price_change_{year}.png")
-    plt.savefig(file_path)
-    plt.close()
+    fig.savefig(file_path)
     logger.info(f"Price change bar saved: {file_path}")
     return file_path
 
@@ -73,41 +98,199 @@ def plot_price_change_bar(df_report, year, out_folder):
 # Portfolio Growth Line
 # -----------------------------
 def plot_portfolio_growth(history_df, out_folder):
-    df = history_df.copy()
-    plt.figure(figsize=(10,6))
-    plt.plot(df['Year'], df['Capital End'], marker='o', linestyle='-', color='blue', linewidth=2)
-
-    for i, row in df.iterrows():
-        plt.text(row['Year'], row['Capital End'], f"{row['Capital End']:,.0f}", ha='center', va='bottom', fontsize=9)
-
-    plt.xlabel("Year")
-    plt.ylabel("Portfolio Value")
-    plt.title("Portfolio Growth Over Time")
-    plt.grid(True, linestyle='--', alpha=0.5)
-    plt.xticks(df['Year'])
-    plt.tight_layout()
+    df = history_df
+    fig, ax = _new_figure((10,6))
+    ax.plot(df['Year'], df['Capital End'], marker='o', linestyle='-', color='blue', linewidth=2)
+
+    for year, value in zip(df['Year'], df['Capital End']):
+        ax.text(year, value, f"{value:,.0f}", ha='center', va='bottom', fontsize=9)
+
+    ax.set_xlabel("Year")
+    ax.set_ylabel("Portfolio Value")
+    ax.set_title("Portfolio Growth Over Time")
+    ax.grid(True, linestyle='--', alpha=0.5)
+    ax.set_xticks(df['Year'])
+    fig.tight_layout()
     file_path = os.path.join(out_folder, "portfolio_growth.png")
-    plt.savefig(file_path)
-    plt.close()
+    fig.savefig(file_path)
     logger.info(f"Portfolio growth line saved: {file_path}")
     return file_path
 
 
+# -----------------------------
+# Plot scheduling: skip unchanged charts, render the rest in parallel
+# -----------------------------
+def _data_hash(name, df):
+    digest = hashlib.sha1(name.encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(",".join(map(str, df.columns)).encode())
+    return digest.hexdigest()
+
+
+def _render(job):
+    func, args = job
+    return func(*args)
+
+
+# -----------------------------
+# Equity series metrics
+# -----------------------------
+# Every function takes an equity curve: a Series of values, or a daily NAV
+# frame (Date, Value) or a history_df (Year, Capital End), and runs in one
+# vectorized pass or an O(n) rolling window.
+TRADING_DAYS_PER_YEAR = 252
+
+DRAWDOWN_COLUMNS = ['Peak', 'Trough', 'Recovery', 'Depth %', 'Duration', 'Time to Recovery']
+
+
+def equity_series(equity):
+    """
+    Equity curve as a float Series: NAV values by date, period-end capital by
+    period label, or a Series as given.
+    """
+    if isinstance(equity, pd.Series):
+        return equity.astype(float)
+    if 'Value' in equity.columns:
+        return pd.Series(equity['Value'].to_numpy(dtype=float), index=pd.Index(equity['Date'], name='Date'))
+    return pd.Series(equity['Capital End'].to_numpy(dtype=float), index=pd.Index(equity['Year'], name='Year'))
+
+
+def period_returns(equity):
+    """
+    Simple return of every step of the curve (one shorter than the curve).
+    """
+    values = equity_series(equity)
+    return values.pct_change().iloc[1:]
+
+
+def rolling_volatility(equity, window, periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Annualized standard deviation of returns over a rolling `window` of steps.
+    """
+    return period_returns(equity).rolling(window).std() * np.sqrt(periods_per_year)
+
+
+def rolling_sharpe(equity, window, periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Annualized Sharpe ratio (zero risk-free rate) over a rolling `window` of steps.
+    """
+    returns = period_returns(equity)
+    rolling = returns.rolling(window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return rolling.mean() / rolling.std() * np.sqrt(periods_per_year)
+
+
+def rolling_sortino(equity, window, periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Annualized Sortino ratio over a rolling `window` of steps: mean return over
+    the downside deviation (root mean square of the negative returns).
+    """
+    returns = period_returns(equity)
+    downside = np.sqrt((returns.clip(upper=0) ** 2).rolling(window).mean())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return returns.rolling(window).mean() / downside * np.sqrt(periods_per_year)
+
+
+def drawdowns(equity):
+    """
+    Drawdown at every point: fraction below the running peak (0 at a new high).
+    """
+    values = equity_series(equity)
+    peaks = np.maximum.accumulate(values.to_numpy())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.nan_to_num((peaks - values.to_numpy()) / peaks)
+    return pd.Series(depth, index=values.index, name='Drawdown')
+
+
+def drawdown_table(equity):
+    """
+    One row per drawdown episode (DRAWDOWN_COLUMNS), deepest first: the labels
+    of its peak, trough and recovery (None while still under water), its depth,
+    its duration from peak to recovery (or to the last point) and the time from
+    trough to recovery (NaN while still under water), both in steps of the curve.
+    """
+    values = equity_series(equity)
+    depth = drawdowns(values).to_numpy()
+    under = depth > 0
+    if not under.any():
+        return pd.DataFrame(columns=DRAWDOWN_COLUMNS)
+
+    # Episodes are contiguous runs of points below the peak
+    starts = np.flatnonzero(under & ~np.r_[False, under[:-1]])
+    ends = np.flatnonzero(under & ~np.r_[under[1:], False])
+    worst = np.maximum.reduceat(depth, starts)
+    worst_at = np.flatnonzero(under & (depth == np.repeat(worst, ends - starts + 1)[np.cumsum(under) - 1]))
+    troughs = worst_at[np.searchsorted(worst_at, starts)]
+
+    recovered = ends + 1 < len(values)
+    recovery = np.where(recovered, ends + 1, len(values) - 1)
+    labels = values.index.to_numpy(dtype=object)
+    table = pd.DataFrame({
+        'Peak': labels[starts - 1],
+        'Trough': labels[troughs],
+        'Recovery': np.where(recovered, labels[recovery], None),
+        'Depth %': worst * 100,
+        'Duration': recovery - (starts - 1),
+        'Time to Recovery': np.where(recovered, recovery - troughs, np.nan)
+    })
+    return table.sort_values('Depth %', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def turnover(df_bought_year, reports_by_year=None):
+    """
+    One-way turnover at every rebalance: half the summed absolute change from
+    the weights held just before it to the weights bought, per period label.
+    The held weights are the drifted 'Weight After 1Y' of the previous drift
+    report when reports are given, otherwise the previous target weights.
+    The first period is bought from cash (turnover 1).
+    """
+    periods = list(df_bought_year)
+    bought = pd.concat(
+        [pd.Series(d['weight'].to_numpy(dtype=float), index=d['ticker'].astype(str).to_numpy()) for d in df_bought_year.values()],
+        keys=range(len(periods))
+    ).groupby(level=[0, 1]).sum()
+    if reports_by_year:
+        position = {period: i for i, period in enumerate(periods)}
+        held = pd.concat(
+            [pd.Series(r['Weight After 1Y'].to_numpy(dtype=float), index=r['Ticker'].astype(str).to_numpy())
+             for p, r in reports_by_year.items() if p in position],
+            keys=[position[p] + 1 for p in reports_by_year if p in position]
+        ).groupby(level=[0, 1]).sum()
+    else:
+        held = bought.rename(index=lambda i: i + 1, level=0)
+
+    # Align on (period, ticker): names only bought or only held count in full
+    change = bought.sub(held, fill_value=0).abs().groupby(level=0).sum() / 2
+    change = change.reindex(range(len(periods)))
+    change.iloc[0] = 1.0
+    return pd.Series(change.to_numpy(), index=pd.Index(periods, name='Year'), name='Turnover')
+
+
 # -----------------------------
 # Run all metrics for the session
 # -----------------------------
-def run_metrics(history_df, session_path, reports_by_year=None):
-    results_folder = os.path.join(session_path, "results")
-    os.makedirs(results_folder, exist_ok=True)
 
+def _period_key(label):
+    # Years stay ints; sub-annual period labels ("2020Q3", "2020-07") stay strings
+    return int(label) if isinstance(label, (int, np.integer)) else str(label)
+
+
+@profiled("metrics")
+def run_metrics(history_df, session_path, reports_by_year=None, nav_df=None, plots=True, workers=None, df_bought_year=None):
+    """
+    Compute summary metrics and save all plots in the session results folder.
+    When a daily NAV series (see simulate_from_file(daily_nav=True)) is given,
+    drawdown, Sharpe and Sortino ratios come from daily returns instead of
+    yearly points, and drawdown durations are counted in trading days.
+    With df_bought_year the average turnover per rebalance is added.
+    plots=False only computes the numbers (session_path may then be None).
+    Charts render in a process pool of `workers` (1 = serial); a chart whose
+    input data is unchanged since the last render is not redrawn.
+    """
     # -----------------------------
     # Compute metrics
-    yearly_cagr = {}
-    for idx, row in history_df.iterrows():
-        start = row['Capital Start']
-        end = row['Capital End']
-        cagr = ((end / start) ** (1/1) - 1) * 100
-        yearly_cagr[int(row['Year'])] = round(float(cagr), 2)
+    growth = (history_df['Capital End'].to_numpy(dtype=float) / history_df['Capital Start'].to_numpy(dtype=float) - 1) * 100
+    yearly_cagr = {_period_key(year): round(float(g), 2) for year, g in zip(history_df['Year'], growth)}
 
     overall_growth = round(float((history_df['Capital End'].iloc[-1] / 
                                   history_df['Capital Start'].iloc[0] - 1) * 100), 2)
@@ -115,26 +298,33 @@ def run_metrics(history_df, session_path, reports_by_year=None):
     total_profit = round(float(history_df['Capital End'].iloc[-1] - 
                                history_df['Capital Start'].iloc[0]), 2)
 
-    capital_series = history_df['Capital End'].cummax()
-    drawdowns = (capital_series - history_df['Capital End']) / capital_series
-    max_drawdown = round(float(drawdowns.max() * 100), 2)
-    year_max_drawdown = int(history_df.loc[drawdowns.idxmax(), 'Year'])
+    if nav_df is not None and len(nav_df) > 1:
+        equity, periods_per_year = nav_df, TRADING_DAYS_PER_YEAR
+    else:
+        equity, periods_per_year = history_df, 1
+    values = equity_series(equity)
+
+    depth = drawdowns(values).to_numpy()
+    max_drawdown = round(float(depth.max() * 100), 2)
+    year_max_drawdown = _period_key(equity['Year'].iloc[int(depth.argmax())])
+    episodes = drawdown_table(values)
 
-    returns = history_df['Capital End'].pct_change().dropna()
-    sharpe_ratio = round(float((returns.mean() / returns.std()) * np.sqrt(1)), 2) if len(returns) > 1 else float('nan')
+    returns = values.pct_change().dropna()
+    if len(returns) > 1:
+        sharpe_ratio = round(float((returns.mean() / returns.std()) * np.sqrt(periods_per_year)), 2)
+        downside = np.sqrt(float((returns.clip(upper=0) ** 2).mean()))
+        sortino_ratio = round(float(returns.mean() / downside * np.sqrt(periods_per_year)), 2) if downside > 0 else float('nan')
+    else:
+        sharpe_ratio = sortino_ratio = float('nan')
 
     # -----------------------------
     # Save yearly plots
     saved_files = []
-    if reports_by_year:
-        for year, report in reports_by_year.items():
-            f1 = plot_weight_change_bar(report, year, results_folder)
-            f2 = plot_price_change_bar(report, year, results_folder)
-            saved_files.extend([f1,f2])
-
-    # Portfolio growth
-    f3 = plot_portfolio_growth(history_df, results_folder)
-    saved_files.append(f3)
+    if plots:
+        results_folder = os.path.join(session_path, "results")
+        os.makedirs(results_folder, exist_ok=True)
+        saved_files = _save_plots(history_df, reports_by_year, results_folder, workers)
+        logger.info(f"All metrics plots saved in {results_folder}")
 
     # -----------------------------
     # Return metrics dict (no printing, just saved files)
@@ -144,9 +334,53 @@ def run_metrics(history_df, session_path, reports_by_year=None):
         'Max Drawdown %': max_drawdown,
         'Year of Max Drawdown': year_max_drawdown,
         'Sharpe Ratio': sharpe_ratio,
+        'Sortino Ratio': sortino_ratio,
+        'Longest Drawdown': int(episodes['Duration'].max()) if len(episodes) else 0,
+        'Time to Recovery': None if not len(episodes) or pd.isna(episodes['Time to Recovery'].iloc[0]) else int(episodes['Time to Recovery'].iloc[0]),
         'Total Profit': total_profit,
         'saved_files': saved_files
     }
+    if df_bought_year:
+        metrics['Average Turnover %'] = round(float(turnover(df_bought_year, reports_by_year).iloc[1:].mean() * 100), 2)
 
-    logger.info(f"All metrics plots saved in {results_folder}")
     return metrics
+
+
+@profiled("plots")
+def _save_plots(history_df, reports_by_year, results_folder, workers=None):
+    jobs = []
+    if reports_by_year:
+        for year, report in reports_by_year.items():
+            jobs.append((f"weight_change_{year}.png", plot_weight_change_bar, report, year))
+            jobs.append((f"price_change_{year}.png", plot_price_change_bar, report, year))
+
+    # Portfolio growth
+    jobs.append(("portfolio_growth.png", plot_portfolio_growth, history_df, None))
+
+    hash_path = os.path.join(results_folder, PLOT_HASH_FILE)
+    previous = {}
+    if os.path.exists(hash_path):
+        with open(hash_path) as f:
+            previous = json.load(f)
+
+    hashes, pending = {}, []
+    for file_name, func, df, year in jobs:
+        hashes[file_name] = _data_hash(f"{file_name}:{year}", df)
+        unchanged = previous.get(file_name) == hashes[file_name]
+        if not (unchanged and os.path.exists(os.path.join(results_folder, file_name))):
+            args = (df, year, results_folder) if year is not None else (df, results_folder)
+            pending.append((func, args))
+
+    workers = workers or os.cpu_count() or 1
+    if len(pending) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, pending))
+    else:
+        for job in pending:
+            _render(job)
+
+    with open(hash_path, "w") as f:
+        json.dump(hashes, f, indent=2)
+
+    logger.info(f"Plots: {len(pending)} rendered, {len(jobs) - len(pending)} unchanged")
+    return [os.path.join(results_folder, file_name) for file_name, *_ in jobs]
@@ -1,99 +1,117 @@
 # backtest/portfolio.py
 
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from datetime import timedelta
-import logging
-from engine.logger import logger  # import your configured logger
+from engine.logger import logger, summarize, Amount  # import your configured logger
+from engine.prices import PriceFetchError, get_default_provider, lookup_prices
+from engine.profiler import profiled
 
 # -----------------------------
 # Helper: Get price for a ticker on or after a date
 # -----------------------------
-def get_price_on_or_after(ticker, date):
+def get_price_on_or_after(ticker, date, provider=None):
     """
     Fetch the close price for a ticker on or after a given date.
     Returns float. Raises ValueError if no price found.
     """
-    try:
-        df = yf.download(
-            ticker,
-            start=date,
-            end=pd.to_datetime(date) + timedelta(days=7),
-            progress=False,
-            auto_adjust=True
-        )['Close']
-
-        if df.empty:
-            raise ValueError(f"No price data for {ticker} after {date}")
-
-        if isinstance(df, pd.Series):
-            return float(df.iloc[0])
-        else:
-            return float(df.iloc[0, 0])
-    except Exception as e:
-        logger.warning(f"Price fetch failed for {ticker} on {date}: {e}")
-        raise
+    price = get_prices_on_or_after([ticker], date, provider).iloc[0]
+    if pd.isna(price):
+        logger.warning("Price fetch failed for %s on %s: No price data for %s after %s", ticker, date, ticker, date)
+        raise ValueError(f"No price data for {ticker} after {date}")
+    return float(price)
+
+# -----------------------------
+# Helper: Get prices for many tickers on or after a date
+# -----------------------------
+def get_prices_on_or_after(tickers, date, provider=None):
+    """
+    Fetch close prices for all tickers on or after a date in one batched call.
+    Returns Series indexed by ticker, NaN where no price was found.
+    """
+    provider = provider or get_default_provider()
+    return provider.get_prices(tickers, [date]).iloc[0]
 
 # -----------------------------
 # Buy shares based on capital and weights
 # -----------------------------
-def buy_shares(df, capital):
+def buy_shares(df, capital, provider=None):
     """
     Allocate capital to tickers based on weights and fetched prices.
     Rows where price cannot be fetched are removed.
     """
-    df = df.copy()
-    prices = []
-    failed_rows = []
+    provider = provider or get_default_provider()
+    df = df.reset_index(drop=True)
 
-    for idx, row in df.iterrows():
-        try:
-            price = get_price_on_or_after(row['ticker'], row['date'])
-            prices.append(price)
-        except Exception:
-            logger.warning(f"Removing {row['ticker']} on {row['date']} due to missing price")
-            failed_rows.append(idx)
-            prices.append(pd.NA)
+    prices = provider.get_prices(df['ticker'], df['date'])
+    df['price'] = lookup_prices(prices, df['ticker'], df['date'])
 
     # Drop rows that failed
-    if failed_rows:
-        df.drop(index=failed_rows, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        prices = [p for i, p in enumerate(prices) if i not in failed_rows]
+    failed = df['price'].isna()
+    if failed.any():
+        logger.warning("Removing tickers due to missing price: %s", summarize(df.loc[failed, 'ticker']),
+                       extra={'fields': {'event': 'missing_buy_price', 'tickers': df.loc[failed, 'ticker'].tolist()}})
+    df = df[~failed].reset_index(drop=True)
 
-    df['price'] = prices
     df['allocation'] = df['weight'] * capital
     df['shares'] = df['allocation'] / df['price']
 
-    logger.info(f"Bought shares for {len(df)} assets, {len(failed_rows)} removed due to missing prices")
+    logger.info("Bought shares for %d assets, %d removed due to missing prices", len(df), int(failed.sum()))
     return df
 
 # -----------------------------
 # Compute portfolio value given shares and prices
 # -----------------------------
-def portfolio_value(df, date_end):
+def portfolio_value(df, date_end, provider=None):
     """
     Compute total portfolio value at a specific date using fetched prices.
     """
-    df = df.copy()
-    prices = []
-    failed_rows = []
+    price_end = get_prices_on_or_after(df['ticker'], date_end, provider)
+    price_end = price_end.reindex(df['ticker'].astype(str)).to_numpy(dtype=float)
 
-    for idx, row in df.iterrows():
-        try:
-            price_end = get_price_on_or_after(row['ticker'], date_end)
-            prices.append(price_end)
-        except Exception:
-            logger.warning(f"Removing {row['ticker']} on {date_end} due to missing price")
-            failed_rows.append(idx)
-            prices.append(pd.NA)
-
-    if failed_rows:
-        df.drop(index=failed_rows, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        prices = [p for i, p in enumerate(prices) if i not in failed_rows]
-
-    df['price_end'] = prices
-    total_value = (df['shares'] * df['price_end']).sum()
-    logger.info(f"Portfolio value on {date_end}: {total_value:,.2f} ({len(df)} assets)")
+    failed = np.isnan(price_end)
+    if failed.any():
+        logger.warning("Removing tickers on %s due to missing price: %s", date_end, summarize(df.loc[failed, 'ticker']),
+                       extra={'fields': {'event': 'missing_end_price', 'tickers': df.loc[failed, 'ticker'].tolist()}})
+
+    total_value = float(np.nansum(df['shares'].to_numpy(dtype=float) * price_end))
+    logger.info("Portfolio value on %s: %s (%d assets)", date_end, Amount(total_value), int((~failed).sum()))
     return total_value
+
+# -----------------------------
+# Daily mark-to-market value of the held portfolios
+# -----------------------------
+@profiled("daily nav")
+def portfolio_nav(df_bought_year, history_df, end_dates, provider=None):
+    """
+    Value held shares at every daily close of each holding period.
+    One bulk history download per period; a ticker without a close yet is
+    carried at its buy price. Each period closes on its rebalance date at
+    the simulated end capital, so the series ties out with history_df.
+    """
+    provider = provider or get_default_provider()
+    capital_end = history_df.set_index('Year')['Capital End']
+    frames = []
+
+    for (year, df_bought), date_end in zip(df_bought_year.items(), end_dates):
+        date_start = pd.to_datetime(df_bought['date']).min()
+        try:
+            closes = provider.get_history(df_bought['ticker'], date_start, date_end)
+        except PriceFetchError as e:
+            logger.warning("Daily prices unavailable for %d tickers in %s (%s); using buy prices", len(e.failed), year, e)
+            closes = e.closes
+        except Exception as e:
+            logger.warning("Daily prices unavailable for %s (%s); using buy prices", year, e)
+            closes = pd.DataFrame(index=pd.DatetimeIndex([date_start]))
+
+        closes = closes.reindex(columns=df_bought['ticker']).ffill()
+        closes = closes.fillna(pd.Series(df_bought['price'].to_numpy(), index=df_bought['ticker']))
+        values = closes.to_numpy(dtype=float) @ df_bought['shares'].to_numpy(dtype=float)
+
+        nav = pd.DataFrame({'Date': closes.index, 'Year': year, 'Value': values})
+        frames.append(nav[nav['Date'] < date_end])
+        frames.append(pd.DataFrame({'Date': [date_end], 'Year': [year], 'Value': [capital_end[year]]}))
+
+    nav_df = pd.concat(frames, ignore_index=True)
+    nav_df = nav_df.drop_duplicates('Date', keep='last').sort_values('Date').reset_index(drop=True)
+    logger.info("Daily NAV computed: %d points over %d periods", len(nav_df), len(df_bought_year))
+    return nav_df
@@ -0,0 +1,358 @@
+# backtest/engine/price_cache.py
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.prices import PriceProvider, PriceFetchError
+from engine.profiler import count
+
+CACHE_DIR = os.environ.get(
+    "BACKTEST_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+)
+DEFAULT_MAX_ROWS = 5_000_000
+_SQL_CHUNK = 500
+# Tickers pivoted per read query; bounds the long (ticker, date, close) frame held at once
+_READ_CHUNK = 100
+
+
+def _chunks(items, size=_SQL_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _day(date):
+    return pd.Timestamp(date).strftime("%Y-%m-%d")
+
+
+# -----------------------------
+# Persistent price store
+# -----------------------------
+class PriceCache:
+    """
+    SQLite store of daily closes keyed by (ticker, date).
+    Besides prices it records which [start, end) ranges were already fetched per ticker,
+    so a range with no trading data (weekend, delisted) is not requested twice.
+    Least recently used tickers are evicted once the store grows past `max_rows`.
+    """
+
+    def __init__(self, cache_dir=None, max_rows=DEFAULT_MAX_ROWS):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_rows = max_rows
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, "prices.sqlite")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS prices (
+                ticker TEXT NOT NULL, date TEXT NOT NULL, close REAL NOT NULL,
+                PRIMARY KEY (ticker, date)
+            );
+            CREATE TABLE IF NOT EXISTS coverage (
+                ticker TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS coverage_ticker ON coverage (ticker);
+            CREATE TABLE IF NOT EXISTS access (
+                ticker TEXT PRIMARY KEY, last_used REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS listing (
+                ticker TEXT PRIMARY KEY, listed INTEGER NOT NULL, checked_at REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    # -----------------------------
+    # Range bookkeeping
+    # -----------------------------
+    def _coverage(self, tickers):
+        covered = {t: [] for t in tickers}
+        for chunk in _chunks(list(tickers)):
+            rows = self._conn.execute(
+                f"SELECT ticker, start, end FROM coverage WHERE ticker IN ({','.join('?' * len(chunk))}) ORDER BY start",
+                chunk
+            ).fetchall()
+            for t, s, e in rows:
+                covered[t].append((s, e))
+        return covered
+
+    def missing_ranges(self, tickers, start, end):
+        """
+        Return {ticker: [(start, end), ...]} of the parts of [start, end) not fetched yet.
+        """
+        start, end = _day(start), _day(end)
+        with self._lock:
+            covered = self._coverage(tickers)
+
+        missing = {}
+        for t in tickers:
+            gaps, cursor = [], start
+            for s, e in covered[t]:
+                if e <= cursor:
+                    continue
+                if s >= end:
+                    break
+                if s > cursor:
+                    gaps.append((cursor, s))
+                cursor = max(cursor, e)
+            if cursor < end:
+                gaps.append((cursor, end))
+            if gaps:
+                missing[t] = gaps
+                self.misses += 1
+            else:
+                self.hits += 1
+        count("price_cache_hits", len(tickers) - len(missing))
+        count("price_cache_misses", len(missing))
+        return missing
+
+    # -----------------------------
+    # Read / write
+    # -----------------------------
+    def store(self, closes, tickers, start, end, evict=True):
+        """
+        Insert fetched closes and mark [start, end) as fetched for `tickers`.
+        Days from today onwards are never marked, as their closes are not final yet.
+        Rows are streamed to SQLite one ticker at a time, never built as one list.
+        evict=False leaves the size limit to a later `evict()` call.
+        """
+        start = _day(start)
+        end = min(_day(end), _day(pd.Timestamp.today()))
+        closes = closes.reindex(columns=list(tickers))
+        days = pd.DatetimeIndex(closes.index).strftime("%Y-%m-%d").to_numpy()
+
+        def rows():
+            for t in closes.columns:
+                values = closes[t].to_numpy(dtype=float)
+                valid = ~np.isnan(values)
+                yield from zip(itertools.repeat(t), days[valid].tolist(), values[valid].tolist())
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?)", rows())
+            if start < end:
+                covered = self._coverage(tickers)
+                for t in tickers:
+                    merged = []
+                    for s, e in sorted(covered[t] + [(start, end)]):
+                        if merged and s <= merged[-1][1]:
+                            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+                        else:
+                            merged.append((s, e))
+                    self._conn.execute("DELETE FROM coverage WHERE ticker = ?", (t,))
+                    self._conn.executemany("INSERT INTO coverage VALUES (?, ?, ?)", [(t, s, e) for s, e in merged])
+            self._touch(tickers)
+            self._conn.commit()
+        if evict:
+            self.evict()
+
+    def read(self, tickers, start, end):
+        """
+        Return cached closes for [start, end) as a DataFrame indexed by date, one column per ticker.
+        Each chunk of tickers is pivoted to wide floats as soon as it is read.
+        """
+        frames = []
+        with self._lock:
+            for chunk in _chunks(list(tickers), _READ_CHUNK):
+                long = pd.read_sql_query(
+                    f"SELECT ticker, date, close FROM prices WHERE date >= ? AND date < ? "
+                    f"AND ticker IN ({','.join('?' * len(chunk))})",
+                    self._conn,
+                    params=[_day(start), _day(end)] + chunk
+                )
+                frames.append(long.pivot(index='date', columns='ticker', values='close'))
+            self._touch(tickers)
+            self._conn.commit()
+
+        wide = pd.concat(frames, axis=1) if frames else pd.DataFrame(dtype=float)
+        wide.index = pd.to_datetime(wide.index)
+        return wide.sort_index().reindex(columns=list(tickers)).astype(float)
+
+    def stored_tickers(self, tickers):
+        """
+        Return the subset of `tickers` with at least one cached close.
+        """
+        found = set()
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                rows = self._conn.execute(
+                    f"SELECT DISTINCT ticker FROM prices WHERE ticker IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(t for (t,) in rows)
+        return found
+
+    # -----------------------------
+    # Listing status
+    # -----------------------------
+    def get_listing(self, tickers, ttl_seconds):
+        """
+        Return {ticker: listed} for tickers checked less than `ttl_seconds` ago.
+        """
+        cutoff = time.time() - ttl_seconds
+        status = {}
+        with self._lock:
+            for chunk in _chunks(list(tickers)):
+                rows = self._conn.execute(
+                    f"SELECT ticker, listed FROM listing WHERE checked_at >= ? AND ticker IN ({','.join('?' * len(chunk))})",
+                    [cutoff] + chunk
+                ).fetchall()
+                status.update((t, bool(listed)) for t, listed in rows)
+        return status
+
+    def set_listing(self, status):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO listing VALUES (?, ?, ?)",
+                [(t, int(listed), now) for t, listed in status.items()]
+            )
+            self._conn.commit()
+
+    def _touch(self, tickers):
+        now = time.time()
+        self._conn.executemany("INSERT OR REPLACE INTO access VALUES (?, ?)", [(t, now) for t in tickers])
+
+    # -----------------------------
+    # Size limit & statistics
+    # -----------------------------
+    def evict(self, max_rows=None):
+        """
+        Drop least recently used tickers until the store holds at most `max_rows` prices.
+        """
+        max_rows = max_rows or self.max_rows
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+            if total <= max_rows:
+                return 0
+
+            counts = dict(self._conn.execute("SELECT ticker, COUNT(*) FROM prices GROUP BY ticker").fetchall())
+            order = [t for (t,) in self._conn.execute("SELECT ticker FROM access ORDER BY last_used")]
+            evicted = []
+            seen = set(order)
+            for t in order + [t for t in counts if t not in seen]:
+                if total <= max_rows:
+                    break
+                total -= counts.get(t, 0)
+                evicted.append(t)
+
+            for chunk in _chunks(evicted):
+                marks = ','.join('?' * len(chunk))
+                for table in ("prices", "coverage", "access"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE ticker IN ({marks})", chunk)
+            self._conn.commit()
+
+        logger.info(f"Price cache evicted {len(evicted)} tickers to stay under {max_rows:,} rows")
+        return len(evicted)
+
+    def clear(self):
+        with self._lock:
+            for table in ("prices", "coverage", "access", "listing"):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+
+    def stats(self):
+        with self._lock:
+            rows, tickers = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT ticker) FROM prices").fetchone()
+        return {
+            'path': self.path,
+            'rows': rows,
+            'tickers': tickers,
+            'size_bytes': os.path.getsize(self.path),
+            'max_rows': self.max_rows,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+# -----------------------------
+# Read-through provider
+# -----------------------------
+class CachedPriceProvider(PriceProvider):
+    """
+    Serves history from a PriceCache and fetches only the missing ranges from `upstream`.
+    Tickers sharing the same gap are fetched together in one upstream call.
+    A gap is marked as fetched only when the upstream confirmed it (see _confirmed);
+    tickers whose gaps were not confirmed are reported through PriceFetchError.
+    """
+
+    def __init__(self, upstream, cache=None):
+        self.upstream = upstream
+        self.cache = cache or PriceCache()
+        self.network_calls = 0
+
+    def get_history(self, tickers, start, end):
+        """
+        Closes of `tickers` over [start, end), cached ones plus the fetched gaps.
+        Raises PriceFetchError carrying those closes when a gap could not be
+        fetched for some tickers, so callers can tell a failure from no data.
+        """
+        tickers = list(pd.unique(pd.Index(tickers)))
+        missing = self.cache.missing_ranges(tickers, start, end)
+
+        by_gap = {}
+        for t, gaps in missing.items():
+            by_gap.setdefault(tuple(gaps), []).append(t)
+
+        failed, reasons = set(), []
+        for gaps, group in by_gap.items():
+            for gap_start, gap_end in gaps:
+                fetched = group
+                try:
+                    closes = self.upstream.get_history(group, gap_start, gap_end)
+                except PriceFetchError as e:
+                    # Keep what arrived; failed tickers stay uncovered and are retried next time
+                    logger.warning("Upstream fetch failed for %d tickers (%s), caching the rest", len(e.failed), e)
+                    closes = e.closes
+                    fetched = [t for t in group if t not in set(e.failed)]
+                    reasons.append(str(e))
+                except Exception as e:
+                    logger.warning("Upstream fetch failed for %d tickers (%s)", len(group), e)
+                    closes = pd.DataFrame(dtype=float)
+                    fetched = []
+                    reasons.append(str(e))
+                self.network_calls += 1
+                confirmed = self._confirmed(closes, fetched, gap_start, gap_end)
+                if len(confirmed) < len(fetched):
+                    reasons.append("empty upstream response")
+                self.cache.store(closes, confirmed, gap_start, gap_end, evict=False)
+                failed.update(set(group) - set(confirmed))
+                del closes
+
+        if missing:
+            logger.info("Price cache filled %d tickers with %d upstream calls so far", len(missing), self.network_calls)
+        # Evict only after reading, so a request larger than the limit is still served whole
+        closes = self.cache.read(tickers, start, end)
+        if missing:
+            self.cache.evict()
+        if failed:
+            failed = [t for t in tickers if t in failed]
+            raise PriceFetchError(f"{len(failed)} tickers failed ({reasons[0]})", closes, failed)
+        return closes
+
+    def source_id(self):
+        return self.upstream.source_id()
+
+    @staticmethod
+    def _confirmed(closes, fetched, start, end):
+        """
+        The tickers of `fetched` whose [start, end) can be marked as covered:
+        all of them when some ticker got closes or the range has no business
+        days, none when an upstream response came back empty (e.g. a network
+        failure), so the range is fetched again next time.
+        """
+        if closes.notna().to_numpy().any():
+            return fetched
+        if len(pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1))) == 0:
+            return fetched
+        if fetched:
+            logger.warning("Upstream returned no closes for %d tickers over [%s, %s), not caching the range", len(fetched), start, end)
+        return []
+
+    def stats(self):
+        return {**self.cache.stats(), 'network_calls': self.network_calls}
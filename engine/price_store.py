@@ -0,0 +1,159 @@
+# backtest/engine/price_store.py
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.prices import LOAD_CHUNK, PRICE_DTYPE, PriceFetchError, TradingDayIndex, get_default_provider, history_chunks, trading_days
+
+# Root folder of the stores PriceMatrix.build reuses; None keeps daily closes in memory
+STORE_DIR = os.environ.get("BACKTEST_PRICE_STORE") or None
+
+VALUES_FILE = "closes.npy"
+INDEX_FILE = "index.json"
+
+
+# -----------------------------
+# Store layout
+# -----------------------------
+def store_key(tickers, start, end, source="", dtype=PRICE_DTYPE):
+    """
+    Folder name of the store holding `tickers` over [start, end), read from
+    `source` (see PriceProvider.source_id) and kept as `dtype`.
+    """
+    text = "|".join([
+        pd.Timestamp(start).strftime("%Y-%m-%d"), pd.Timestamp(end).strftime("%Y-%m-%d"),
+        str(source), np.dtype(dtype).name, *map(str, tickers)
+    ])
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _write_index(folder, days, symbols, dtype):
+    with open(os.path.join(folder, INDEX_FILE), "w") as f:
+        json.dump({
+            'dtype': np.dtype(dtype).name,
+            'days': [d.strftime("%Y-%m-%d") for d in pd.DatetimeIndex(days)],
+            'symbols': [str(s) for s in symbols]
+        }, f)
+
+
+def _publish(tmp, folder):
+    # Rename into place; another process that got there first wins
+    try:
+        os.replace(tmp, folder)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(folder, INDEX_FILE)):
+            raise
+    return folder
+
+
+# -----------------------------
+# Writing
+# -----------------------------
+def write_store(folder, tickers, start, end, provider=None, chunk_size=LOAD_CHUNK):
+    """
+    Build a store of the daily closes of `tickers` over [start, end) from
+    `provider` (default: the cached default provider), `chunk_size` tickers per
+    history call. Chunks are spilled to disk as they arrive and copied into the
+    final (trading days x tickers) array, so the panel is never held in memory.
+    Raises PriceFetchError, with the closes in memory, when any ticker failed
+    to fetch: such a store is not published, so a later run fetches again.
+    """
+    tickers = list(tickers)
+    tmp = f"{folder}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    spilled, failed = [], []
+    for i, closes in enumerate(history_chunks(tickers, start, end, provider, chunk_size, failed)):
+        path = os.path.join(tmp, f"chunk_{i:05d}.npy")
+        np.save(path, closes.to_numpy())
+        spilled.append((path, closes.index, closes.shape[1]))
+    days = trading_days(index for _, index, _ in spilled)
+
+    values = np.lib.format.open_memmap(os.path.join(tmp, VALUES_FILE), mode='w+', dtype=PRICE_DTYPE, shape=(len(days), len(tickers)))
+    values[:] = np.nan
+    col = 0
+    for path, index, width in spilled:
+        values[days.get_indexer(index), col:col + width] = np.load(path, mmap_mode='r')
+        col += width
+        os.remove(path)
+    values.flush()
+
+    if failed:
+        closes = TradingDayIndex(np.array(values), days, tickers).closes
+        del values
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise PriceFetchError(f"Price store not written: {len(failed)} tickers failed to fetch", closes, failed)
+    del values
+
+    _write_index(tmp, days, tickers, PRICE_DTYPE)
+    logger.info("Price store written: %d trading days x %d tickers in %s", len(days), len(tickers), folder)
+    return _publish(tmp, folder)
+
+
+def save_store(days, folder):
+    """
+    Write an in-memory TradingDayIndex as a store (e.g. to share it with worker processes).
+    """
+    tmp = f"{folder}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    np.save(os.path.join(tmp, VALUES_FILE), days.values)
+    _write_index(tmp, days.days, days.symbols, days.values.dtype)
+    return _publish(tmp, folder)
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+def open_store(folder):
+    """
+    Memory-map a store as a read-only TradingDayIndex. Lookups and history
+    slices read straight from the file, and every process mapping the same
+    store shares one copy in the OS page cache.
+    """
+    with open(os.path.join(folder, INDEX_FILE)) as f:
+        index = json.load(f)
+    values = np.load(os.path.join(folder, VALUES_FILE), mmap_mode='r')
+    return TradingDayIndex(values, pd.DatetimeIndex(index['days']), index['symbols'], path=folder)
+
+
+def load_days(tickers, start, end, provider=None, store_dir=None):
+    """
+    Daily closes of `tickers` over [start, end): memory-mapped from the store
+    under `store_dir` (default STORE_DIR), written first if it does not exist
+    yet, or loaded into memory when no store folder is configured.
+    Spans reaching today are always loaded into memory, as their latest
+    closes are not final yet.
+    """
+    store_dir = store_dir or STORE_DIR
+    if not store_dir:
+        return TradingDayIndex.load(tickers, start, end, provider)
+    if pd.Timestamp(end) > pd.Timestamp.today().normalize():
+        logger.info("Price store skipped: span ends after today (%s)", pd.Timestamp(end).date())
+        return TradingDayIndex.load(tickers, start, end, provider)
+
+    tickers = list(tickers)
+    provider = provider or get_default_provider()
+    folder = os.path.join(store_dir, store_key(tickers, start, end, provider.source_id()))
+    if os.path.exists(os.path.join(folder, INDEX_FILE)):
+        logger.info("Price store reused: %s", folder)
+    else:
+        os.makedirs(store_dir, exist_ok=True)
+        try:
+            write_store(folder, tickers, start, end, provider)
+        except PriceFetchError as e:
+            logger.warning("%s; closes kept in memory", e)
+            return TradingDayIndex.from_frame(e.closes)
+    return open_store(folder)
+
+
+def set_store_dir(path):
+    """
+    Change the root folder of the stores PriceMatrix.build uses (None: in memory).
+    """
+    global STORE_DIR
+    STORE_DIR = path or None
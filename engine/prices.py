@@ -0,0 +1,418 @@
+# backtest/engine/prices.py
+
+import os
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.profiler import count, profiled
+
+# A price "on or after" a date is the first close found in this many calendar days
+ON_OR_AFTER_WINDOW_DAYS = 7
+
+# Upstream sources: yfinance downloads, or the chart API through the async fetcher
+PRICE_SOURCES = ("yfinance", "chart")
+
+# Storage type of preloaded closes; float32 halves price memory (about 7 significant digits)
+PRICE_DTYPE = np.dtype(os.environ.get("BACKTEST_PRICE_DTYPE", "float64"))
+
+# Tickers per history call when preloading a span, so no call builds the whole panel at once
+LOAD_CHUNK = 500
+
+
+# -----------------------------
+# Provider interface
+# -----------------------------
+class PriceFetchError(RuntimeError):
+    """
+    Raised by a provider when some tickers could not be fetched.
+    `closes` holds what was fetched; `failed` lists the tickers that are missing
+    because of the error (not because they have no data).
+    """
+
+    def __init__(self, message, closes=None, failed=()):
+        super().__init__(message)
+        self.closes = closes if closes is not None else pd.DataFrame(dtype=float)
+        self.failed = list(failed)
+
+
+class PriceProvider:
+    """
+    Base class for close-price sources.
+    Subclasses implement `get_history`; batched on-or-after lookups come for free.
+    """
+
+    def get_history(self, tickers, start, end):
+        """
+        Return daily closes for `tickers` in [start, end).
+        DataFrame indexed by date with one column per ticker.
+        """
+        raise NotImplementedError
+
+    def source_id(self):
+        """
+        Text identifying where the closes come from; part of the price store key,
+        so stores built from different sources are never mixed up.
+        """
+        return type(self).__name__
+
+    def get_prices(self, tickers, dates):
+        """
+        Return the first close on or after each date for every ticker.
+        DataFrame indexed by date (dates x tickers), NaN where no price was found.
+        The whole universe is fetched with a single history call per date.
+        """
+        tickers = list(pd.unique(pd.Index(tickers)))
+        dates = pd.DatetimeIndex(pd.unique(pd.to_datetime(pd.Index(dates)))).normalize()
+
+        rows = []
+        for date in dates:
+            try:
+                hist = self.get_history(tickers, date, date + timedelta(days=ON_OR_AFTER_WINDOW_DAYS))
+            except PriceFetchError as e:
+                logger.warning("Price fetch failed for %d of %d tickers on %s: %s", len(e.failed), len(tickers), date.date(), e)
+                hist = e.closes
+            except Exception as e:
+                logger.warning("Price fetch failed for %d tickers on %s: %s", len(tickers), date.date(), e)
+                hist = pd.DataFrame()
+            hist = hist.reindex(columns=tickers)
+            rows.append(hist.bfill().iloc[0] if not hist.empty else pd.Series(np.nan, index=tickers))
+
+        prices = pd.DataFrame(rows, index=dates, columns=tickers, dtype=float)
+        prices.index.name = 'date'
+        return prices
+
+
+# -----------------------------
+# Yahoo Finance provider
+# -----------------------------
+class YFinancePriceProvider(PriceProvider):
+    """
+    Fetches adjusted closes from Yahoo Finance, all tickers in one request.
+    Raises PriceFetchError (carrying the partial result) for the tickers
+    yfinance failed to download, or for all of them if the request failed.
+    """
+
+    def get_history(self, tickers, start, end):
+        import yfinance as yf
+        import yfinance.shared
+
+        tickers = list(tickers)
+        count("network_requests")
+        try:
+            data = yf.download(
+                tickers,
+                start=pd.to_datetime(start),
+                end=pd.to_datetime(end),
+                progress=False,
+                auto_adjust=True
+            )
+        except Exception as e:
+            raise PriceFetchError(f"Yahoo download failed ({e})", pd.DataFrame(columns=tickers, dtype=float), tickers) from e
+
+        if data.empty:
+            closes = pd.DataFrame(columns=tickers, dtype=float)
+        else:
+            closes = data['Close']
+            if isinstance(closes, pd.Series):
+                closes = closes.to_frame(name=tickers[0])
+            closes.index = pd.to_datetime(closes.index).tz_localize(None).normalize()
+            closes = closes.reindex(columns=tickers).astype(float)
+
+        # yfinance logs per-ticker failures instead of raising; it keeps them in shared._ERRORS
+        errors = getattr(yfinance.shared, "_ERRORS", {})
+        failed = [t for t in tickers if t in errors]
+        if failed:
+            raise PriceFetchError(f"{len(failed)} tickers failed ({errors[failed[0]]})", closes, failed)
+        return closes
+
+
+# -----------------------------
+# Local file provider
+# -----------------------------
+class LocalPriceProvider(PriceProvider):
+    """
+    Serves closes from a local CSV/Parquet file (or an in-memory DataFrame).
+    Accepts long format (date, ticker, close) or wide format (date + one column per ticker).
+    """
+
+    def __init__(self, source):
+        if isinstance(source, pd.DataFrame):
+            df = source.copy()
+            self.source = f"frame:{pd.util.hash_pandas_object(df, index=True).sum()}"
+        else:
+            self.source = f"{os.path.abspath(source)}@{os.path.getmtime(source) if os.path.exists(source) else 0}"
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Price file not found: {source}")
+            ext = os.path.splitext(source)[1].lower()
+            if ext == ".csv":
+                df = pd.read_csv(source)
+            elif ext == ".parquet":
+                df = pd.read_parquet(source)
+            else:
+                raise ValueError(f"Unsupported price file format: {ext}")
+
+        if {'date', 'ticker', 'close'}.issubset(df.columns):
+            df = df.pivot_table(index='date', columns='ticker', values='close', aggfunc='last')
+        elif 'date' in df.columns:
+            df = df.set_index('date')
+
+        df.index = pd.to_datetime(df.index).normalize()
+        df.columns = df.columns.astype(str)
+        self.closes = df.sort_index().astype(float)
+        logger.info(f"Local prices loaded: {self.closes.shape[1]} tickers, {len(self.closes)} dates")
+
+    def source_id(self):
+        return f"{type(self).__name__}:{self.source}"
+
+    def stored_tickers(self, tickers):
+        """
+        Return the subset of `tickers` with at least one close in the file.
+        """
+        present = self.closes.reindex(columns=list(tickers)).notna().any()
+        return set(present.index[present])
+
+    def get_history(self, tickers, start, end):
+        start, end = pd.to_datetime(start), pd.to_datetime(end)
+        window = self.closes[(self.closes.index >= start) & (self.closes.index < end)]
+        return window.reindex(columns=list(tickers))
+
+
+# -----------------------------
+# Trading-day index
+# -----------------------------
+class TradingDayIndex(PriceProvider):
+    """
+    Daily closes preloaded for a span as one contiguous (trading days x tickers)
+    PRICE_DTYPE array, with the tickers as a symbol table (`symbols`).
+    An on-or-after lookup is a searchsorted on the trading days followed by a
+    scan of the few rows inside the window, so it never goes back to the network.
+    `path` is the price store folder when the array is memory-mapped from disk.
+    """
+
+    def __init__(self, values, days, symbols, path=None):
+        # A memory-mapped array (see engine.price_store) is used as is, in its stored dtype
+        self.values = values if isinstance(values, np.memmap) else np.ascontiguousarray(values, dtype=PRICE_DTYPE)
+        self.days = np.asarray(days, dtype='datetime64[ns]')
+        self.symbols = pd.Index(symbols, dtype=str)
+        self.path = path
+
+    @classmethod
+    def from_frame(cls, closes):
+        closes = closes.sort_index()
+        closes = closes[~closes.index.duplicated(keep='last')]
+        return cls(closes.to_numpy(dtype=PRICE_DTYPE), closes.index, closes.columns.astype(str))
+
+    @classmethod
+    def load(cls, tickers, start, end, provider=None, chunk_size=LOAD_CHUNK):
+        """
+        Batched history calls for `tickers` over [start, end), `chunk_size` tickers at a time.
+        Tickers that fail to fetch are left empty (NaN) with a warning.
+        """
+        tickers = list(tickers)
+        chunks = list(history_chunks(tickers, start, end, provider, chunk_size))
+        days = trading_days(closes.index for closes in chunks)
+
+        # Fill one preallocated array chunk by chunk, releasing each chunk as it is copied
+        values = np.full((len(days), len(tickers)), np.nan, dtype=PRICE_DTYPE)
+        col = 0
+        while chunks:
+            closes = chunks.pop(0)
+            values[days.get_indexer(closes.index), col:col + closes.shape[1]] = closes.to_numpy()
+            col += closes.shape[1]
+        return cls(values, days, tickers)
+
+    @property
+    def closes(self):
+        """
+        The closes as a DataFrame over the same memory (no copy).
+        """
+        return pd.DataFrame(self.values, index=pd.DatetimeIndex(self.days, name='date'), columns=self.symbols, copy=False)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.days.nbytes
+
+    def get_prices(self, tickers, dates):
+        tickers = list(pd.unique(pd.Index(tickers)))
+        dates = pd.DatetimeIndex(pd.unique(pd.to_datetime(pd.Index(dates)))).normalize()
+
+        cols = self.symbols.get_indexer(pd.Index(tickers).astype(str))
+        safe_cols = np.maximum(cols, 0)
+        first = np.searchsorted(self.days, dates.to_numpy(dtype='datetime64[ns]'), side='left')
+        limit = np.searchsorted(self.days, (dates + timedelta(days=ON_OR_AFTER_WINDOW_DAYS)).to_numpy(dtype='datetime64[ns]'), side='left')
+
+        # Scan the (at most a handful of) trading days inside each window
+        values = np.full((len(dates), len(tickers)), np.nan, dtype=PRICE_DTYPE)
+        found = np.zeros(values.shape, dtype=bool)
+        last = len(self.days) - 1
+        for k in range(int((limit - first).max(initial=0))):
+            rows = first + k
+            candidates = self.values[np.minimum(rows, last)][:, safe_cols]
+            take = (rows < limit)[:, None] & ~found & ~np.isnan(candidates)
+            values[take] = candidates[take]
+            found |= take
+        values[:, cols < 0] = np.nan
+
+        prices = pd.DataFrame(values, index=dates, columns=tickers)
+        prices.index.name = 'date'
+        return prices
+
+    def get_history(self, tickers, start, end):
+        first, stop = np.searchsorted(self.days, pd.DatetimeIndex([start, end]).to_numpy(dtype='datetime64[ns]'), side='left')
+        tickers = list(tickers)
+        cols = self.symbols.get_indexer(pd.Index(tickers).astype(str))
+        if len(cols) and cols[0] >= 0 and (np.diff(cols) == 1).all():
+            # A run of adjacent symbols is a plain slice: a view, no copy
+            window = self.values[first:stop, cols[0]:cols[-1] + 1]
+        else:
+            window = self.values[first:stop][:, np.maximum(cols, 0)]
+            window[:, cols < 0] = np.nan
+        return pd.DataFrame(window, index=pd.DatetimeIndex(self.days[first:stop], name='date'), columns=tickers, copy=False)
+
+
+def history_chunks(tickers, start, end, provider=None, chunk_size=LOAD_CHUNK, failed=None):
+    """
+    Yield the daily closes of `tickers` over [start, end), one history call per
+    `chunk_size` tickers, each as a PRICE_DTYPE frame with the chunk's columns
+    in order and unique normalized dates. Failed tickers are left empty with a
+    warning and appended to the `failed` list when one is given.
+    """
+    provider = provider or get_default_provider()
+    tickers = list(tickers)
+    failed = [] if failed is None else failed
+    for i in range(0, len(tickers), chunk_size):
+        chunk = tickers[i:i + chunk_size]
+        try:
+            closes = provider.get_history(chunk, start, end)
+        except PriceFetchError as e:
+            logger.warning("Price fetch failed for %d of %d tickers: %s", len(e.failed), len(chunk), e)
+            closes = e.closes
+            failed.extend(e.failed)
+        except Exception as e:
+            logger.warning("Price fetch failed for %d tickers: %s", len(chunk), e)
+            closes = pd.DataFrame(dtype=float)
+            failed.extend(chunk)
+        closes = closes.reindex(columns=chunk).astype(PRICE_DTYPE)
+        closes.index = pd.DatetimeIndex(closes.index).normalize()
+        yield closes[~closes.index.duplicated(keep='last')]
+
+
+def trading_days(indexes):
+    """
+    Sorted union of date indexes.
+    """
+    days = pd.DatetimeIndex([])
+    for index in indexes:
+        days = days.union(index)
+    return days.sort_values()
+
+
+# -----------------------------
+# Per-run price matrix
+# -----------------------------
+class PriceMatrix(PriceProvider):
+    """
+    Dates x tickers frame of on-or-after closes fetched once for a whole run.
+    Passed to every stage as a provider, so no price is looked up twice.
+    `days` is the TradingDayIndex it was built from (None when loaded from
+    elsewhere); daily histories are served from it when present.
+    """
+
+    def __init__(self, prices, days=None):
+        self.prices = prices
+        self.days = days
+
+    @classmethod
+    @profiled("fetch prices")
+    def build(cls, needs, provider=None, store_dir=None):
+        """
+        Price every (date, ticker) pair listed in `needs` ({date: tickers}).
+        Daily closes for the whole span are loaded once into a TradingDayIndex,
+        so the fetch volume does not grow with the number of rebalance dates.
+        With a store folder (`store_dir`, or BACKTEST_PRICE_STORE) the closes are
+        memory-mapped from a price store there instead (see engine.price_store).
+        """
+        tickers_by_date = {}
+        for date, tickers in needs.items():
+            tickers_by_date.setdefault(pd.Timestamp(date).normalize(), set()).update(tickers)
+        if not tickers_by_date:
+            return cls(pd.DataFrame(dtype=float))
+
+        dates = sorted(tickers_by_date)
+        tickers = sorted(set().union(*tickers_by_date.values()))
+        if isinstance(provider, PriceMatrix):
+            # Already on-or-after prices (e.g. a sweep's shared matrix): pick the dates
+            return cls(provider.get_prices(tickers, dates), provider.days)
+
+        from engine.price_store import load_days
+        days = load_days(tickers, dates[0], dates[-1] + timedelta(days=ON_OR_AFTER_WINDOW_DAYS), provider, store_dir)
+        prices = days.get_prices(tickers, dates)
+
+        lookups = sum(len(t) for t in tickers_by_date.values())
+        logger.info("Price matrix built: %d dates x %d tickers (%d lookups) from %d trading days (%.1f MiB%s)",
+                    len(prices), prices.shape[1], lookups, len(days.days), days.nbytes / 2**20,
+                    ", memory-mapped" if days.path else "")
+        return cls(prices, days)
+
+    def get_prices(self, tickers, dates):
+        tickers = list(pd.unique(pd.Index(tickers)))
+        dates = pd.DatetimeIndex(pd.unique(pd.to_datetime(pd.Index(dates)))).normalize()
+        prices = self.prices.reindex(index=dates, columns=tickers)
+        prices.index.name = 'date'
+        return prices
+
+    def get_history(self, tickers, start, end):
+        if self.days is not None:
+            return self.days.get_history(tickers, start, end)
+        start, end = pd.to_datetime(start), pd.to_datetime(end)
+        window = self.prices[(self.prices.index >= start) & (self.prices.index < end)]
+        return window.reindex(columns=list(tickers))
+
+
+# -----------------------------
+# Default provider
+# -----------------------------
+_default_provider = None
+
+
+def make_provider(source="yfinance"):
+    """
+    Upstream `source` (see PRICE_SOURCES) read through the persistent price cache.
+    """
+    if source not in PRICE_SOURCES:
+        raise ValueError(f"Unknown price source: {source} (expected one of {PRICE_SOURCES})")
+
+    from engine.price_cache import CachedPriceProvider
+    if source == "chart":
+        from engine.fetcher import YahooChartPriceProvider
+        return CachedPriceProvider(YahooChartPriceProvider())
+    return CachedPriceProvider(YFinancePriceProvider())
+
+
+def get_default_provider():
+    """
+    Provider used when a function is called without an explicit one:
+    Yahoo Finance read through the persistent price cache.
+    BACKTEST_PRICE_SOURCE selects the upstream (default: yfinance).
+    """
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = make_provider(os.environ.get("BACKTEST_PRICE_SOURCE", "yfinance"))
+    return _default_provider
+
+
+def set_default_provider(provider):
+    global _default_provider
+    _default_provider = provider
+
+
+def lookup_prices(prices, tickers, dates):
+    """
+    Pick one price per (ticker, date) row out of a dates x tickers frame.
+    """
+    rows = prices.index.get_indexer(pd.to_datetime(pd.Index(dates)).normalize())
+    cols = prices.columns.get_indexer(pd.Index(tickers))
+    values = prices.to_numpy(dtype=float)[rows, cols]
+    values[(rows < 0) | (cols < 0)] = np.nan
+    return values
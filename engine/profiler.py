@@ -0,0 +1,211 @@
+# backtest/engine/profiler.py
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from engine.logger import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The profiler currently recording, None when profiling is off
+_active = None
+
+
+# -----------------------------
+# Process memory
+# -----------------------------
+def rss_bytes():
+    """
+    Current resident set size of this process, or None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """
+    High-water mark of this process's resident set size, or None where unsupported.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# -----------------------------
+# Recording
+# -----------------------------
+class Profiler:
+    """
+    Records wall time, call counts, counters (network requests, cache hits and
+    misses, ...), peak traced memory and process RSS per named stage.
+    `rss_bytes` is the resident set size when the stage last finished and
+    `peak_rss_bytes` the process high-water mark at that point, so the first
+    stage reaching the run's peak RSS is where it happened.
+    Use as a context manager; while active, `stage`, `profiled` and `count`
+    anywhere in the engine report into it.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.seconds = 0.0
+        self.peak_bytes = 0
+        self.peak_rss_bytes = None
+        self._stack = []
+        self._started = None
+        self._owns_tracemalloc = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = None
+        self.seconds = time.perf_counter() - self._started
+        self.peak_bytes = max(tracemalloc.get_traced_memory()[1], *(s['peak_bytes'] for s in self.stages.values()), 0)
+        self.peak_rss_bytes = peak_rss_bytes()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    def count(self, name, n=1):
+        # Called from worker threads too (listing checks, price fetches)
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        # tracemalloc keeps one peak, so each stage resets it and hands its
+        # own peak back to the enclosing stage on exit
+        frame = {'peak': tracemalloc.get_traced_memory()[1], 'counters': dict(self.counters)}
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], frame['peak'])
+        self._stack.append(frame)
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self._stack.pop()
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+            record = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'rss_bytes': None, 'peak_rss_bytes': None, 'counters': {}})
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['peak_bytes'] = max(record['peak_bytes'], peak)
+            record['rss_bytes'] = rss_bytes()
+            record['peak_rss_bytes'] = peak_rss_bytes()
+            for key, value in self.counters.items():
+                delta = value - frame['counters'].get(key, 0)
+                if delta:
+                    record['counters'][key] = record['counters'].get(key, 0) + delta
+
+    # -----------------------------
+    # Output
+    # -----------------------------
+    def to_dict(self):
+        return {
+            'total_seconds': round(self.seconds, 6),
+            'peak_bytes': self.peak_bytes,
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'counters': dict(self.counters),
+            'stages': [
+                {'stage': name, **record, 'seconds': round(record['seconds'], 6)}
+                for name, record in self.stages.items()
+            ]
+        }
+
+    def write_trace(self, path):
+        """
+        Write the trace as JSON and return the path.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Profile trace saved to: {path}")
+        return path
+
+    def summary_table(self):
+        """
+        Rich table with one row per stage, slowest first.
+        """
+        from rich.table import Table
+
+        rss = f", peak RSS {self.peak_rss_bytes / 2**20:,.1f} MiB" if self.peak_rss_bytes else ""
+        table = Table(title=f"Profile — {self.seconds:.2f}s total, peak {self.peak_bytes / 2**20:,.1f} MiB traced{rss}")
+        for col in ("Stage", "Calls", "Seconds", "% Total", "Peak MiB", "RSS MiB", "Counters"):
+            table.add_column(col, justify="left" if col in ("Stage", "Counters") else "right")
+
+        total = self.seconds or 1.0
+        for name, record in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            table.add_row(
+                name,
+                str(record['calls']),
+                f"{record['seconds']:.3f}",
+                f"{100 * record['seconds'] / total:.1f}",
+                f"{record['peak_bytes'] / 2**20:,.1f}",
+                f"{record['rss_bytes'] / 2**20:,.1f}" if record['rss_bytes'] else "",
+                ", ".join(f"{k}={v}" for k, v in sorted(record['counters'].items()))
+            )
+        return table
+
+
+# -----------------------------
+# Hooks used by the engine (no-ops while profiling is off)
+# -----------------------------
+@contextmanager
+def _no_stage():
+    yield
+
+
+def stage(name):
+    """
+    Context manager timing a block as stage `name`.
+    """
+    return _active.stage(name) if _active is not None else _no_stage()
+
+
+def count(name, n=1):
+    """
+    Add `n` to counter `name` of the active profiler.
+    """
+    if _active is not None:
+        _active.count(name, n)
+
+
+def profiled(name):
+    """
+    Decorator timing every call of a function as stage `name`.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
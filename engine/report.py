@@ -1,14 +1,118 @@
 # backtest/engine/report.py
-from engine.logger import info, warning
-from engine.portfolio import get_price_on_or_after
+from engine.logger import info, warning, summarize
+from engine.portfolio import get_prices_on_or_after
+from engine.profiler import profiled
+import numpy as np
 import pandas as pd
 
+REPORT_COLUMNS = [
+    'Ticker',
+    'Buy Price',
+    'Shares Bought',
+    'Weight at Buy',
+    'Price After 1Y',
+    'Weight After 1Y',
+    'Weight Change',
+    'Action at Rebalance',
+    'Sold in Profit?',
+    'Sell Price (Rebalance)'
+]
+
+# -----------------------------
+# All years at once
+# -----------------------------
+@profiled("drift reports")
+def build_drift_reports(df_bought_year, capital_start_year, end_prices, allocations):
+    """
+    Builds the drift reports of every year as one long frame indexed by (year, ticker).
+
+    Args:
+        df_bought_year: {year: df_bought} with ticker, price and shares
+        capital_start_year: {year: capital at buy}
+        end_prices: DataFrame indexed by year, one column per ticker (price at rebalance)
+        allocations: frame with year and ticker of every allocation row;
+            a holding is Rebought if its ticker is allocated in the next allocation year
+
+    Returns:
+        long report frame (see split_drift_reports for the per-year views)
+    """
+    df = pd.concat(
+        [d[['ticker', 'price', 'shares']].assign(year=year) for year, d in df_bought_year.items()],
+        ignore_index=True
+    )
+    years = df['year'].to_numpy()
+    tickers = df['ticker'].astype(str).to_numpy()
+
+    # End-of-year prices: one fancy-indexing lookup for all rows
+    rows = end_prices.index.get_indexer(years)
+    cols = end_prices.columns.get_indexer(tickers)
+    price_end = end_prices.to_numpy(dtype=float)[rows, cols]
+    price_end[(rows < 0) | (cols < 0)] = np.nan
+
+    # Remove tickers with missing price
+    valid = ~np.isnan(price_end)
+    for year in pd.unique(years[~valid]):
+        missing_prices = tickers[~valid & (years == year)].tolist()
+        warning("Removing tickers in %s report due to missing price: %s", year, summarize(missing_prices),
+                event="missing_report_price", year=year, tickers=missing_prices)
+    df, years, tickers, price_end = df[valid], years[valid], tickers[valid], price_end[valid]
+
+    price = df['price'].to_numpy(dtype=float)
+    shares = df['shares'].to_numpy(dtype=float)
+    capital = pd.Series(capital_start_year).reindex(years).to_numpy(dtype=float)
+
+    weight_start = shares * price / capital
+    value_end = shares * price_end
+    total_end = pd.Series(value_end).groupby(years).transform('sum').to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_end = np.where(total_end > 0, value_end / total_end, 0.0)
+
+    # Rebalance action: is (next allocation year, ticker) allocated?
+    alloc_years = np.unique(allocations['year'].to_numpy())
+    pos = np.searchsorted(alloc_years, years, side='right')
+    padded = np.append(alloc_years, -1)
+    next_years = padded[pos]
+    allocated = pd.MultiIndex.from_arrays([allocations['year'].to_numpy(), allocations['ticker'].astype(str).to_numpy()])
+    rebought = pd.MultiIndex.from_arrays([next_years, tickers]).isin(allocated)
+
+    report = pd.DataFrame({
+        'Ticker': tickers,
+        'Buy Price': price,
+        'Shares Bought': shares,
+        'Weight at Buy': weight_start,
+        'Price After 1Y': price_end,
+        'Weight After 1Y': weight_end,
+        'Weight Change': weight_end - weight_start,
+        'Action at Rebalance': np.where(rebought, 'Rebought', 'Sold'),
+        'Sold in Profit?': np.where(rebought, '—', np.where(price_end > price, 'Yes', 'No')),
+        'Sell Price (Rebalance)': np.where(rebought, np.nan, price_end)
+    }, index=pd.MultiIndex.from_arrays([years, tickers], names=['year', 'ticker']))
+
+    info("Portfolio drift reports prepared for %d years (%d rows)", len(df_bought_year), len(report))
+    return report
+
+
+def split_drift_reports(report):
+    """
+    Per-year views of a long drift report: {year: report} with the REPORT_COLUMNS layout.
+    """
+    years = report.index.get_level_values('year')
+    return {
+        year: report[years == year].reset_index(drop=True)[REPORT_COLUMNS]
+        for year in pd.unique(years)
+    }
+
+
+# -----------------------------
+# Single year
+# -----------------------------
 def report_yearly_purchases_with_drift(
     df_bought,
     capital,
     year,
     date_end,
-    next_year_tickers
+    next_year_tickers,
+    provider=None
 ):
     """
     Generates a yearly portfolio drift report:
@@ -19,86 +123,15 @@ def report_yearly_purchases_with_drift(
     Returns:
         report: DataFrame of yearly report (without printing)
     """
-
-    df = df_bought.copy().reset_index(drop=True)  # safe indexing
-
-    # -----------------------------
-    # Start-of-year values
-    # -----------------------------
-    df['value_start'] = df['shares'] * df['price']
-    df['weight_start'] = df['value_start'] / capital
-
-    # -----------------------------
-    # End-of-year prices & values
-    # -----------------------------
-    df['price_end'] = df['ticker'].apply(lambda t: get_price_on_or_after(t, date_end))
-
-    # Remove tickers with missing price
-    missing_prices = df[df['price_end'].isna()]['ticker'].tolist()
-    if missing_prices:
-        warning(f"Removing tickers on {date_end.date()} due to missing price: {missing_prices}")
-        df = df[df['price_end'].notna()].reset_index(drop=True)
-
-    df['value_end'] = df['shares'] * df['price_end']
-    total_end_value = df['value_end'].sum()
-    df['weight_end'] = df['value_end'] / total_end_value if total_end_value > 0 else 0
-
-    # -----------------------------
-    # Weight drift
-    # -----------------------------
-    df['weight_change'] = df['weight_end'] - df['weight_start']
-
-    # -----------------------------
-    # Rebalance action logic
-    # -----------------------------
-    df['Action at Rebalance'] = df['ticker'].apply(
-        lambda t: 'Rebought' if t in next_year_tickers else 'Sold'
+    price_end = get_prices_on_or_after(df_bought['ticker'], date_end, provider)
+    # Period 0 is this one and period 1 the next, whatever the labels look like
+    report = build_drift_reports(
+        {0: df_bought},
+        {0: capital},
+        pd.DataFrame([price_end.to_numpy()], index=[0], columns=price_end.index.astype(str)),
+        pd.DataFrame({'year': 1, 'ticker': list(next_year_tickers)})
     )
 
-    df['Sold in Profit?'] = df.apply(
-        lambda x:
-            'Yes' if x['Action at Rebalance'] == 'Sold' and x['price_end'] > x['price']
-            else 'No' if x['Action at Rebalance'] == 'Sold'
-            else '—',
-        axis=1
-    )
-
-    df['Sell Price (Rebalance)'] = df.apply(
-        lambda x: x['price_end'] if x['Action at Rebalance'] == 'Sold' else None,
-        axis=1
-    )
-
-    # -----------------------------
-    # Final report table
-    # -----------------------------
-    report = df[[
-        'ticker',
-        'price',
-        'shares',
-        'weight_start',
-        'price_end',
-        'weight_end',
-        'weight_change',
-        'Action at Rebalance',
-        'Sold in Profit?',
-        'Sell Price (Rebalance)'
-    ]].copy()
-
-    report.columns = [
-        'Ticker',
-        'Buy Price',
-        'Shares Bought',
-        'Weight at Buy',
-        'Price After 1Y',
-        'Weight After 1Y',
-        'Weight Change',
-        'Action at Rebalance',
-        'Sold in Profit?',
-        'Sell Price (Rebalance)'
-    ]
-
-    info(f"Portfolio drift report prepared for year {year} — capital start: {capital:,.2f}, total end: {total_end_value:,.2f}")
-
     # Do NOT print here — main.py will handle CLI printing & CSV saving
 
-    return report
\ No newline at end of file
+    return split_drift_reports(report).get(0, pd.DataFrame(columns=REPORT_COLUMNS))
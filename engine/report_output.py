@@ -0,0 +1,107 @@
+# backtest/engine/report_output.py
+
+import os
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.profiler import profiled
+
+# Extra report files besides the session store's results/reports.feather:
+# "xlsx" writes one workbook with a sheet per period, "csv" report_<period>.csv per period
+REPORT_FORMATS = ("xlsx", "csv")
+
+# Holdings shown per period in the terminal, largest weight drift first (0 shows all)
+DEFAULT_TOP = 20
+
+
+# -----------------------------
+# Extra exports
+# -----------------------------
+@profiled("export reports")
+def export_reports(reports_by_year, results_dir, fmt):
+    """
+    Write the drift reports of all periods into `results_dir` as reports.xlsx
+    (one sheet per period) or report_<period>.csv files. Returns the paths written.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt} (expected one of {REPORT_FORMATS})")
+
+    if fmt == "xlsx":
+        path = os.path.join(results_dir, "reports.xlsx")
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for year, report in reports_by_year.items():
+                report.to_excel(writer, sheet_name=str(year)[:31], index=False)
+        paths = [path]
+    else:
+        paths = []
+        for year, report in reports_by_year.items():
+            paths.append(os.path.join(results_dir, f"report_{year}.csv"))
+            report.to_csv(paths[-1], index=False)
+
+    logger.info("Drift reports for %d periods saved as %s: %s", len(reports_by_year), fmt, paths[0] if len(paths) == 1 else results_dir)
+    return paths
+
+
+# -----------------------------
+# Cell formatting
+# -----------------------------
+def format_frame(df, decimals=2):
+    """
+    Every cell of a frame as display text: numbers as f"{v:,.2f}", others as str.
+    Returns {column: list of strings}.
+    """
+    return {
+        col: [f"{v:,.{decimals}f}" for v in df[col].to_numpy(dtype=float)]
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        else df[col].astype(str).tolist()
+        for col in df.columns
+    }
+
+
+# -----------------------------
+# Terminal rendering
+# -----------------------------
+def top_movers(report, top=DEFAULT_TOP, page=1):
+    """
+    Rows of a report ordered by absolute weight change, largest first:
+    the `page`-th block of `top` rows (all rows when top is 0).
+    """
+    order = np.argsort(-np.abs(report['Weight Change'].to_numpy(dtype=float)), kind='stable')
+    if top:
+        order = order[(page - 1) * top:page * top]
+    return report.iloc[order]
+
+
+def drift_table(report, year, top=DEFAULT_TOP, page=1):
+    """
+    rich Table of one period's top movers (see top_movers), with a caption
+    saying which rows of how many are shown.
+    """
+    from rich import box
+    from rich.table import Table
+
+    rows = top_movers(report, top, page)
+    table = Table(title=f"Portfolio Drift Report — Year {year}", show_lines=True, box=box.SIMPLE_HEAVY)
+    if top and len(report) > len(rows):
+        first = (page - 1) * top
+        pages = -(-len(report) // top)
+        table.caption = (f"Holdings {first + 1}–{first + len(rows)} of {len(report)} by weight change "
+                         f"(page {page} of {pages})" if len(rows) else f"No holdings on page {page} of {pages}")
+
+    cells = format_frame(rows)
+    for col in rows.columns:
+        numeric = pd.api.types.is_numeric_dtype(rows[col])
+        table.add_column(col, justify="right" if numeric else "left")
+    for values in zip(*cells.values()):
+        table.add_row(*values)
+    return table
+
+
+def render_reports(reports_by_year, console, top=DEFAULT_TOP, page=1):
+    """
+    Print every period's drift table (see drift_table) to a rich console.
+    """
+    if page < 1:
+        raise ValueError("page must be at least 1")
+    for year, report in reports_by_year.items():
+        console.print(drift_table(report, year, top, page))
@@ -0,0 +1,212 @@
+# backtest/engine/resample.py
+
+import argparse
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.profiler import profiled
+
+RESAMPLE_METHODS = ("block", "assets", "normal")
+OUTCOME_COLUMNS = ['Overall Portfolio Growth %', 'Max Drawdown %', 'Sharpe Ratio']
+
+# Upper bound on array elements generated per chunk (about 32 MiB of float64)
+MAX_CHUNK_ELEMENTS = 2**22
+
+
+# -----------------------------
+# Inputs
+# -----------------------------
+def asset_period_returns(reports_by_year):
+    """
+    Per-period asset returns implied by the held portfolios, from the drift reports.
+    Long frame with period, ticker, weight (at buy) and gross (end price / buy price).
+    Weight that could not be valued at the period end (dropped from the report)
+    is kept as a '<lost>' row with gross 0, as in the simulation.
+    """
+    frames = []
+    for period, report in reports_by_year.items():
+        weight = report['Weight at Buy'].to_numpy(dtype=float)
+        gross = (report['Price After 1Y'] / report['Buy Price']).to_numpy(dtype=float)
+        frame = pd.DataFrame({'period': period, 'ticker': report['Ticker'].astype(str), 'weight': weight, 'gross': gross})
+        lost = 1.0 - weight.sum()
+        if lost > 1e-9:
+            frame.loc[len(frame)] = [period, '<lost>', lost, 0.0]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def portfolio_returns(asset_returns):
+    """
+    Historical return of each period: weighted gross return of its holdings minus 1.
+    """
+    weighted = asset_returns['weight'] * asset_returns['gross']
+    grouped = pd.DataFrame({'wg': weighted, 'w': asset_returns['weight'], 'period': asset_returns['period']}).groupby('period', sort=True)
+    sums = grouped.sum()
+    return (sums['wg'] / sums['w'] - 1).to_numpy()
+
+
+# -----------------------------
+# Path metrics
+# -----------------------------
+def path_metrics(returns, periods_per_year=1):
+    """
+    run_metrics outcomes for every row of a (paths x periods) return array,
+    with run_metrics' history_df definitions: growth from start to final
+    capital, drawdown over period-end capital, Sharpe ratio of the period-end
+    capital changes. Returns (growth %, max drawdown %, Sharpe) arrays.
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=float))
+    values = np.cumprod(1.0 + returns, axis=1)
+    growth = (values[:, -1] - 1.0) * 100
+
+    peaks = np.maximum.accumulate(values, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_drawdown = np.nan_to_num((peaks - values) / peaks).max(axis=1) * 100
+
+        changes = returns[:, 1:]
+        if changes.shape[1] > 1:
+            # A path repeating one return has no volatility: no Sharpe ratio rather than inf
+            std = changes.std(axis=1, ddof=1)
+            sharpe = np.where(std > 0, changes.mean(axis=1) / std, np.nan) * np.sqrt(periods_per_year)
+        else:
+            sharpe = np.full(len(returns), np.nan)
+    return growth, max_drawdown, sharpe
+
+
+# -----------------------------
+# Path generation
+# -----------------------------
+def _chunk_rows(width, chunk_size=None):
+    rows = max(1, MAX_CHUNK_ELEMENTS // max(1, width))
+    return min(rows, chunk_size) if chunk_size else rows
+
+
+def _block_paths(rng, returns, n, block_size):
+    # Circular moving-block bootstrap of the period return sequence
+    periods = len(returns)
+    blocks = -(-periods // block_size)
+    starts = rng.integers(0, periods, size=(n, blocks))
+    idx = (starts[:, :, None] + np.arange(block_size)) % periods
+    return returns[idx.reshape(n, -1)[:, :periods]]
+
+
+def _normal_paths(rng, returns, n):
+    # Log-normal Monte Carlo with the mean and volatility of historical log returns
+    logs = np.log1p(returns)
+    sigma = logs.std(ddof=1) if len(logs) > 1 else 0.0
+    return np.expm1(rng.normal(logs.mean(), sigma, size=(n, len(returns))))
+
+
+def _asset_paths(rng, groups, n):
+    # Each period's holdings redrawn with replacement; weights renormalized per draw
+    out = np.empty((n, len(groups)))
+    for p, (weight, weighted) in enumerate(groups):
+        idx = rng.integers(0, len(weight), size=(n, len(weight)))
+        out[:, p] = weighted[idx].sum(axis=1) / weight[idx].sum(axis=1) - 1.0
+    return out
+
+
+def resample_paths(asset_returns, n_paths, method="block", block_size=1, seed=0, chunk_size=None):
+    """
+    Yield (chunk x periods) arrays of resampled period returns, n_paths rows in total.
+
+    - block: circular block bootstrap of the historical period returns
+      (block_size consecutive periods per draw keeps serial dependence).
+    - assets: every period's holdings are redrawn with replacement (the
+      period order is kept), so results depend less on a few holdings.
+    - normal: Monte Carlo from a log-normal fit of the period returns.
+
+    Chunks hold at most MAX_CHUNK_ELEMENTS draws (fewer with chunk_size),
+    so memory does not grow with n_paths.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"Unknown resampling method: {method} (expected one of {RESAMPLE_METHODS})")
+    if block_size < 1:
+        raise ValueError("block_size must be at least 1")
+
+    rng = np.random.default_rng(seed)
+    returns = portfolio_returns(asset_returns)
+    if method == "assets":
+        groups = [
+            (g['weight'].to_numpy(dtype=float), (g['weight'] * g['gross']).to_numpy(dtype=float))
+            for _, g in asset_returns.groupby('period', sort=True)
+        ]
+        width = sum(len(w) for w, _ in groups)
+    else:
+        width = len(returns) * (block_size if method == "block" else 1)
+
+    rows = _chunk_rows(width, chunk_size)
+    for done in range(0, n_paths, rows):
+        n = min(rows, n_paths - done)
+        if method == "block":
+            yield _block_paths(rng, returns, n, block_size)
+        elif method == "normal":
+            yield _normal_paths(rng, returns, n)
+        else:
+            yield _asset_paths(rng, groups, n)
+
+
+@profiled("resampling")
+def run_resampling(reports_by_year, n_paths=10_000, method="block", block_size=1, seed=0, chunk_size=None, periods_per_year=1):
+    """
+    Resample the backtest n_paths times (see resample_paths) and return one
+    row of run_metrics outcomes per path (OUTCOME_COLUMNS).
+    """
+    asset_returns = asset_period_returns(reports_by_year)
+    outcomes = np.empty((n_paths, len(OUTCOME_COLUMNS)))
+    done = 0
+    for paths in resample_paths(asset_returns, n_paths, method, block_size, seed, chunk_size):
+        outcomes[done:done + len(paths)] = np.column_stack(path_metrics(paths, periods_per_year))
+        done += len(paths)
+
+    logger.info("Resampled %d paths (%s) over %d periods", n_paths, method, asset_returns['period'].nunique())
+    return pd.DataFrame(outcomes, columns=OUTCOME_COLUMNS)
+
+
+def outcome_distribution(outcomes, historical=None, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Percentiles, mean and standard deviation of every outcome column.
+    With `historical` (asset returns of the actual run), adds the historical
+    value and the share of paths at or below it.
+    """
+    table = pd.DataFrame({f"p{q}": outcomes.quantile(q / 100) for q in percentiles})
+    table['mean'] = outcomes.mean()
+    table['std'] = outcomes.std()
+
+    if historical is not None:
+        actual = path_metrics(portfolio_returns(historical)[None, :])
+        table['historical'] = [float(a[0]) for a in actual]
+        table['historical rank'] = [float((outcomes[c] <= v).mean()) for c, v in zip(OUTCOME_COLUMNS, table['historical'])]
+    return table
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bootstrap / Monte Carlo robustness analysis of a saved session.")
+    parser.add_argument("session", help="Session folder (e.g. Sessions/run_1)")
+    parser.add_argument("--paths", type=int, default=10_000, help="Number of resampled paths")
+    parser.add_argument("--method", choices=list(RESAMPLE_METHODS), default="block", help="Resampling method")
+    parser.add_argument("--block-size", type=int, default=1, help="Periods per bootstrap block (block method)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--out", default=None, help="Also save every path's outcomes to this CSV")
+    args = parser.parse_args(argv)
+
+    from engine.session import load_session
+
+    reports_by_year = load_session(args.session).get('reports_by_year')
+    if not reports_by_year:
+        parser.error(f"No drift reports saved in session: {args.session}")
+
+    outcomes = run_resampling(reports_by_year, args.paths, args.method, args.block_size, args.seed)
+    table = outcome_distribution(outcomes, asset_period_returns(reports_by_year))
+    print(table.round(4).to_string())
+    if args.out:
+        outcomes.to_csv(args.out, index=False)
+        logger.info(f"Resampled outcomes saved to: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
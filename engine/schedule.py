@@ -0,0 +1,111 @@
+# backtest/engine/schedule.py
+
+import numpy as np
+import pandas as pd
+
+SCHEDULE_KINDS = ("yearly", "quarterly", "monthly", "next", "dates")
+
+# Holding period of the calendar schedules, in months from the period's first buy date
+PERIOD_MONTHS = {'yearly': 12, 'quarterly': 3, 'monthly': 1}
+
+
+class RebalanceSchedule:
+    """
+    Groups allocation rows into holding periods and says when each period ends.
+
+    - yearly / quarterly / monthly: rows are grouped by calendar year, quarter or
+      month and each period is held 12, 3 or 1 months from its first buy date
+      (a July 1st yearly allocation is held to the next July 1st).
+    - next: every allocation date starts a period held until the next allocation
+      date; the last period is held as long as the one before it (a year if alone),
+      in calendar months when that gap is a whole number of months.
+    - dates: allocation dates are grouped by the window between two explicit
+      rebalance `dates` they fall in; each window is one period, held from its
+      first buy date until the rebalance date closing the window.
+
+    Period labels key the per-period outputs (history_df 'Year', reports,
+    holdings): the year for yearly schedules, "2020Q3", "2020-07" or
+    "2020-07-01" otherwise. Labels sort in period order.
+    """
+
+    def __init__(self, kind="yearly", dates=None):
+        if kind not in SCHEDULE_KINDS:
+            raise ValueError(f"Unknown rebalance schedule: {kind} (expected one of {SCHEDULE_KINDS})")
+        if kind == "dates":
+            if dates is None or len(dates) == 0:
+                raise ValueError("A 'dates' schedule needs at least one rebalance date")
+            dates = pd.DatetimeIndex(pd.to_datetime(list(dates))).normalize().unique().sort_values()
+        self.kind = kind
+        self.dates = dates
+
+    @classmethod
+    def parse(cls, spec=None):
+        """
+        Schedule from None (yearly), a kind name, a list of rebalance dates or a schedule.
+        """
+        if spec is None:
+            return cls()
+        if isinstance(spec, cls):
+            return spec
+        if isinstance(spec, str):
+            return cls(spec)
+        return cls("dates", spec)
+
+    def __repr__(self):
+        if self.kind == "dates":
+            return f"RebalanceSchedule('dates', {len(self.dates)} dates)"
+        return f"RebalanceSchedule({self.kind!r})"
+
+    def labels(self, dates, offset_days=0):
+        """
+        Period label of every allocation date. `offset_days` is the shift already
+        applied to the dates; explicit rebalance dates move with it.
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        if self.kind == "yearly":
+            return dates.year.to_numpy()
+        if self.kind == "quarterly":
+            return np.asarray(dates.to_period('Q').astype(str))
+        if self.kind == "monthly":
+            return np.asarray(dates.strftime('%Y-%m'))
+        if self.kind == "dates":
+            # One period per rebalance window, labelled by its first buy date
+            first = pd.Series(dates).groupby(self._windows(dates, offset_days)).transform('min')
+            return np.asarray(pd.DatetimeIndex(first).strftime('%Y-%m-%d'))
+        return np.asarray(dates.strftime('%Y-%m-%d'))
+
+    def _windows(self, dates, offset_days):
+        # Index of the first explicit rebalance date after each (unshifted) date
+        shifted = (pd.DatetimeIndex(dates) - pd.Timedelta(days=offset_days)).normalize()
+        return np.searchsorted(self.dates.to_numpy(), shifted.to_numpy(), side='right')
+
+    def end_dates(self, starts, offset_days=0):
+        """
+        Rebalance (holding-period end) date of each period, given the periods'
+        first buy dates in period order. `offset_days` is the shift already
+        applied to the buy dates; explicit rebalance dates move with it.
+        """
+        starts = pd.DatetimeIndex(pd.to_datetime(list(starts)))
+        if self.kind in PERIOD_MONTHS:
+            return list(starts + pd.DateOffset(months=PERIOD_MONTHS[self.kind]))
+
+        if self.kind == "next":
+            if len(starts) == 1:
+                return [starts[0] + pd.DateOffset(years=1)]
+            return list(starts[1:]) + [starts[-1] + _gap(starts[-2], starts[-1])]
+
+        offset = pd.Timedelta(days=offset_days)
+        pos = self._windows(starts, offset_days)
+        if (pos == len(self.dates)).any():
+            late = starts[pos == len(self.dates)][0] - offset
+            raise ValueError(f"No rebalance date after allocation date {late.date()}")
+        return list(self.dates[pos] + offset)
+
+
+def _gap(earlier, later):
+    # Whole calendar months when the days of month match, so a July 1st
+    # schedule stays on July 1st across leap years
+    months = (later.year - earlier.year) * 12 + later.month - earlier.month
+    if later.day == earlier.day and months > 0:
+        return pd.DateOffset(months=months)
+    return later - earlier
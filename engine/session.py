@@ -0,0 +1,89 @@
+# backtest/engine/session.py
+
+import os
+import pandas as pd
+from engine.logger import logger
+from engine.profiler import profiled
+
+# Session artifacts, relative to the session folder
+SESSION_FILES = {
+    'df_clean': os.path.join("processed_data", "df_clean.feather"),
+    'history_df': os.path.join("results", "history.feather"),
+    'holdings': os.path.join("results", "holdings.feather"),
+    'reports': os.path.join("results", "reports.feather"),
+    'nav_df': os.path.join("results", "daily_nav.feather")
+}
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _stack_years(frames_by_year):
+    # One long frame with a leading `year` column instead of one file per year
+    return pd.concat(
+        [df.assign(year=year)[['year', *df.columns]] for year, df in frames_by_year.items()],
+        ignore_index=True
+    )
+
+
+def _split_years(df):
+    return {year: part.drop(columns='year').reset_index(drop=True) for year, part in df.groupby('year', sort=True)}
+
+
+def _write(df, path):
+    # Uncompressed Arrow IPC so reads can memory-map the file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.reset_index(drop=True).to_feather(path, compression="uncompressed")
+
+
+def _read(path):
+    import pyarrow.feather as feather
+
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+# -----------------------------
+# Save / load
+# -----------------------------
+@profiled("save_session")
+def save_session(session_path, df_clean=None, history_df=None, df_bought_year=None, reports_by_year=None, nav_df=None):
+    """
+    Persist whichever session artifacts are given as Feather files.
+    Holdings and reports are stored as single long frames with a `year` column.
+    """
+    artifacts = {
+        'df_clean': df_clean,
+        'history_df': history_df,
+        'holdings': _stack_years(df_bought_year) if df_bought_year else None,
+        'reports': _stack_years(reports_by_year) if reports_by_year else None,
+        'nav_df': nav_df
+    }
+    saved = []
+    for name, df in artifacts.items():
+        if df is not None:
+            path = os.path.join(session_path, SESSION_FILES[name])
+            _write(df, path)
+            saved.append(path)
+
+    logger.info(f"Session artifacts saved: {', '.join(os.path.basename(p) for p in saved)}")
+    return saved
+
+
+def load_session(session_path):
+    """
+    Load every saved artifact of a session with memory-mapped reads.
+    Returns a dict with df_clean, history_df, df_bought_year, reports_by_year
+    and nav_df (only the ones that exist).
+    """
+    session = {}
+    for name, rel_path in SESSION_FILES.items():
+        path = os.path.join(session_path, rel_path)
+        if os.path.exists(path):
+            session[name] = _read(path)
+
+    if 'holdings' in session:
+        session['df_bought_year'] = _split_years(session.pop('holdings'))
+    if 'reports' in session:
+        session['reports_by_year'] = _split_years(session.pop('reports'))
+
+    logger.info(f"Session loaded from {session_path}: {', '.join(session)}")
+    return session
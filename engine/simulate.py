@@ -1,16 +1,23 @@
 # backtest/simulate.py
 
 import pandas as pd
-from engine.portfolio import buy_shares, portfolio_value
-from engine.report import report_yearly_purchases_with_drift
-from engine.logger import logger
-
-def simulate_from_file(file_path, initial_capital):
+from engine.portfolio import buy_shares, portfolio_value, portfolio_nav
+from engine.report import build_drift_reports, split_drift_reports
+from engine.prices import PriceMatrix
+from engine.schedule import RebalanceSchedule
+from engine.vectorized import simulate_vectorized
+from engine.year_cache import YearCache, year_fingerprint
+from engine.logger import logger, summarize, Amount
+from engine.profiler import stage
+
+SIMULATION_METHODS = ("loop", "vectorized")
+
+def load_allocations(file_path):
+    """
+    Read a processed allocation file (ticker, date, weight) for simulation.
+    """
     logger.info(f"Loading data from file: {file_path}")
 
-    # -----------------------------
-    # Load file
-    # -----------------------------
     ext = file_path.split('.')[-1].lower()
     if ext == "csv":
         df_all = pd.read_csv(file_path)
@@ -18,73 +25,205 @@ def simulate_from_file(file_path, initial_capital):
         df_all = pd.read_excel(file_path)
     else:
         raise ValueError("File must be CSV or Excel")
+    return df_all
+
+
+def prepare_allocations(df_all, rebalance_offset_days=0, schedule=None):
+    """
+    Parse dates (shifted by `rebalance_offset_days`) and add the `year` column
+    holding each row's period label under the rebalance `schedule`
+    (see RebalanceSchedule.parse; yearly by default).
+    Tickers become a categorical column: integer codes against one symbol
+    table shared by every period's frames.
+    A period whose holding period would run past the next period's first buy
+    date is rebalanced on that date instead. A period grouping several buy
+    dates splits its capital evenly across them, so each date's weights apply
+    to its share of the period's capital.
+    Returns df_all, sorted period labels and the rebalance end date of each period.
+    """
+    schedule = RebalanceSchedule.parse(schedule)
+    df_all = df_all.copy()
+    df_all['ticker'] = df_all['ticker'].astype(str).astype('category')
+    df_all['date'] = pd.to_datetime(df_all['date']) + pd.Timedelta(days=rebalance_offset_days)
+    df_all['year'] = schedule.labels(df_all['date'], rebalance_offset_days)
+
+    # Capital is spent once per period, however many buy dates it groups
+    buy_dates = df_all.groupby('year')['date'].transform('nunique')
+    if (buy_dates > 1).any():
+        logger.info("Capital split across the buy dates of %d periods", df_all.loc[buy_dates > 1, 'year'].nunique())
+        df_all['weight'] = df_all['weight'] / buy_dates
+
+    starts = df_all.groupby('year')['date'].min().sort_index()
+    end_dates = schedule.end_dates(starts, rebalance_offset_days)
+
+    # Capital is chained from one period to the next, so a period is sold no
+    # later than the next period's first buy date
+    overlapping = [label for label, end, following in zip(starts.index, end_dates, starts.iloc[1:]) if end > following]
+    if overlapping:
+        logger.warning("Periods held past the next period's first buy date are rebalanced on it: %s", summarize(overlapping))
+        end_dates = [min(end, following) for end, following in zip(end_dates, starts.iloc[1:])] + end_dates[-1:]
+    return df_all, list(starts.index), end_dates
+
+
+def price_needs(df_all, end_dates):
+    """
+    Map every date the run prices on (buy dates plus rebalance end dates) to the tickers needed there.
+    """
+    years = sorted(df_all['year'].unique())
+    needs = {}
+    for year, date_end in zip(years, end_dates):
+        df_year = df_all[df_all['year'] == year]
+        for date, tickers in df_year.groupby('date')['ticker']:
+            needs.setdefault(date, set()).update(tickers)
+        needs.setdefault(date_end, set()).update(df_year['ticker'])
+    return needs
+
+
+def end_price_frame(prices, years, end_dates):
+    """
+    Rebalance-date prices from the run's PriceMatrix, indexed by period.
+    """
+    end_prices = prices.prices.reindex(index=pd.DatetimeIndex(end_dates))
+    end_prices.index = years
+    return end_prices
+
+
+def simulate_from_file(file_path, initial_capital, provider=None, method="loop", daily_nav=False, rebalance_offset_days=0, year_cache=None, schedule=None):
+    """
+    Run the backtest for an allocation file (see simulate_portfolio).
+    """
+    return simulate_portfolio(
+        load_allocations(file_path),
+        initial_capital,
+        provider=provider,
+        method=method,
+        daily_nav=daily_nav,
+        rebalance_offset_days=rebalance_offset_days,
+        year_cache=year_cache,
+        schedule=schedule
+    )
+
+
+def simulate_portfolio(df_all, initial_capital, provider=None, method="loop", daily_nav=False, rebalance_offset_days=0, year_cache=None, schedule=None):
+    """
+    Run the backtest on an allocation frame (ticker, date, weight).
+    schedule (see RebalanceSchedule.parse) sets the holding periods: yearly
+    by default, or quarterly, monthly, "next" allocation date or explicit
+    rebalance dates. Per-period outputs are keyed by the period label.
+    method="loop" walks the years with DataFrames; method="vectorized" runs
+    all years as NumPy array operations and returns the same outputs.
+    daily_nav=True also returns a daily mark-to-market series (served from
+    the run's preloaded daily closes) as a fifth element.
+    rebalance_offset_days shifts buy and rebalance dates by that many days.
+    year_cache (a YearCache, or True for the default one) lets the loop engine
+    reuse years whose inputs are unchanged since an earlier run; the vectorized
+    engine has no year cache and raises ValueError if one is given.
+    """
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f"Unknown simulation method: {method} (expected one of {SIMULATION_METHODS})")
+    if year_cache and method == "vectorized":
+        raise ValueError("year_cache only applies to method='loop'; the vectorized engine always simulates every period")
 
     required_cols = ['ticker', 'date', 'weight']
     if not all(col in df_all.columns for col in required_cols):
         raise ValueError(f"File must contain columns: {required_cols}")
+    if df_all.empty:
+        raise ValueError("No allocation rows to simulate (were all tickers filtered out as delisted?)")
 
-    df_all['date'] = pd.to_datetime(df_all['date'])
-    df_all['year'] = df_all['date'].dt.year
-    years = sorted(df_all['year'].unique())
-    logger.info(f"Data contains {len(years)} years: {years}")
+    df_all, years, end_dates = prepare_allocations(df_all, rebalance_offset_days, schedule)
+    logger.info("Data contains %d periods: %s", len(years), summarize(years))
+
+    # -----------------------------
+    # Fetch every price the run needs once: buy dates plus rebalance end dates
+    # -----------------------------
+    prices = PriceMatrix.build(price_needs(df_all, end_dates), provider)
 
+    if method == "vectorized":
+        with stage("simulate vectorized"):
+            results = simulate_vectorized(df_all, years, prices, initial_capital, end_dates)
+    else:
+        if year_cache is True:
+            year_cache = YearCache()
+        results = _simulate_loop(df_all, years, prices, initial_capital, end_dates, year_cache or None)
+
+    history_df = results[0]
+    logger.info("Simulation completed.")
+    logger.info("Final capital after %s: %s", years[-1], Amount(history_df['Capital End'].iloc[-1]))
+
+    if daily_nav:
+        nav_df = portfolio_nav(results[1], history_df, end_dates, prices if prices.days is not None else provider)
+        return (*results, nav_df)
+    return results
+
+
+def _simulate_loop(df_all, years, prices, initial_capital, end_dates, year_cache=None):
     capital = initial_capital
     history = []
     df_bought_year = {}
     capital_start_year = {}
-    reports_by_year = {}
+    reused = 0
 
     # -----------------------------
     # Yearly simulation loop
     # -----------------------------
     for i, year in enumerate(years):
-        logger.info(f"Processing year {year}")
-        df_year = df_all[df_all['year'] == year].copy()
-        capital_start_year[year] = capital
-
-        # Buy shares at start of year
-        df_bought = buy_shares(df_year[['ticker', 'date', 'weight']], capital).copy()
-
-        # Drop rows with missing starting prices
-        if df_bought['price'].isna().any():
-            missing_tickers = df_bought[df_bought['price'].isna()]['ticker'].tolist()
-            logger.warning(f"Dropping tickers with missing start prices: {missing_tickers}")
-            df_bought = df_bought.dropna(subset=['price']).reset_index(drop=True)
-
-        if df_bought.empty:
-            raise RuntimeError(f"No valid assets to simulate in year {year} after removing missing prices.")
-
-        # Re-normalize weights
-        df_bought['weight'] = df_bought['weight'] / df_bought['weight'].sum()
-
-        # Next-year tickers for rebalance logic
-        next_year_tickers = set(df_all[df_all['year'] == years[i + 1]]['ticker']) if i < len(years) - 1 else set()
-
-        # Generate yearly report
-        report = report_yearly_purchases_with_drift(
-            df_bought=df_bought,
-            capital=capital,
-            year=year,
-            date_end=pd.to_datetime(f"{year + 1}-07-01"),
-            next_year_tickers=next_year_tickers
-        )
-        reports_by_year[year] = report
-
-        # Calculate end-of-year portfolio value
-        total_value = portfolio_value(df_bought, pd.to_datetime(f"{year + 1}-07-01"))
-        logger.info(f"End-of-year capital for {year}: {total_value:,.2f}")
-
-        # Store cleaned portfolio and history
-        df_bought_year[year] = df_bought.copy()
-        history.append({
-            'Year': year,
-            'Capital Start': capital,
-            'Capital End': total_value
-        })
-        capital = total_value
+        with stage(f"year {year}"):
+            logger.info("Processing year %s", year)
+            df_year = df_all[df_all['year'] == year]
+            capital_start_year[year] = capital
+
+            # Reuse the year if its inputs are unchanged
+            if year_cache is not None:
+                fingerprint = year_fingerprint(df_year, capital, end_dates[i], prices)
+                cached = year_cache.get(fingerprint)
+                if cached is not None:
+                    df_bought, total_value = cached
+                    logger.info("Year %s reused from cache, end-of-year capital: %s", year, Amount(total_value))
+                    df_bought_year[year] = df_bought
+                    history.append({'Year': year, 'Capital Start': capital, 'Capital End': total_value})
+                    capital = total_value
+                    reused += 1
+                    continue
+
+            # Buy shares at start of year
+            df_bought = buy_shares(df_year[['ticker', 'date', 'weight']], capital, prices)
+
+            # Drop rows with missing starting prices
+            if df_bought['price'].isna().any():
+                missing_tickers = df_bought[df_bought['price'].isna()]['ticker'].tolist()
+                logger.warning("Dropping tickers with missing start prices: %s", summarize(missing_tickers))
+                df_bought = df_bought.dropna(subset=['price']).reset_index(drop=True)
+
+            if df_bought.empty:
+                raise RuntimeError(f"No valid assets to simulate in year {year} after removing missing prices.")
+
+            # Re-normalize weights
+            df_bought['weight'] = df_bought['weight'] / df_bought['weight'].sum()
+
+            # Calculate end-of-year portfolio value
+            total_value = portfolio_value(df_bought, end_dates[i], prices)
+            logger.info("End-of-year capital for %s: %s", year, Amount(total_value))
+
+            # Store cleaned portfolio and history
+            df_bought_year[year] = df_bought
+            if year_cache is not None:
+                year_cache.put(fingerprint, df_bought, total_value)
+            history.append({
+                'Year': year,
+                'Capital Start': capital,
+                'Capital End': total_value
+            })
+            capital = total_value
 
     history_df = pd.DataFrame(history)
-    logger.info("Simulation completed.")
-    logger.info(f"Final capital after {years[-1]}: {capital:,.2f}")
-
+    if year_cache is not None:
+        logger.info("Year cache: %d years reused, %d simulated", reused, len(years) - reused)
+
+    # Drift reports for all years in one pass
+    reports_by_year = split_drift_reports(build_drift_reports(
+        df_bought_year,
+        capital_start_year,
+        end_price_frame(prices, years, end_dates),
+        df_all[['year', 'ticker']]
+    ))
     return history_df, df_bought_year, capital_start_year, reports_by_year
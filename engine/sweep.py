@@ -0,0 +1,183 @@
+# backtest/engine/sweep.py
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.prices import PriceMatrix, LocalPriceProvider
+from engine.price_store import open_store, save_store
+from engine.simulate import load_allocations, prepare_allocations, price_needs, simulate_portfolio
+from engine.metrics import run_metrics
+
+DEFAULT_CONFIG = {
+    'initial_capital': 100000.0,
+    'rebalance_offset_days': 0,
+    'schedule': 'yearly',
+    'weight_noise': 0.0,
+    'seed': 0,
+    'method': 'vectorized'
+}
+
+# -----------------------------
+# Configuration grid
+# -----------------------------
+def expand_grid(base, grid):
+    """
+    Cartesian product of `grid` ({param: [values]}) on top of `base` and DEFAULT_CONFIG.
+    Every config gets a `name` (run_0000, run_0001, ...) unless one is given.
+    """
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        config = {**DEFAULT_CONFIG, **base, **dict(zip(keys, values))}
+        config.setdefault('name', f"run_{len(configs):04d}")
+        configs.append(config)
+    return configs
+
+
+def perturb_weights(df, noise, seed):
+    """
+    Scale each weight by (1 + noise * N(0, 1)), floor at 0 and renormalize per date.
+    """
+    if not noise:
+        return df
+    df = df.copy()
+    rng = np.random.default_rng(seed)
+    weights = df['weight'].to_numpy(dtype=float) * np.clip(1 + noise * rng.standard_normal(len(df)), 0, None)
+    df['weight'] = weights / pd.Series(weights).groupby(df['date'].to_numpy()).transform('sum').to_numpy()
+    return df
+
+
+# -----------------------------
+# Price dataset shared with the workers
+# -----------------------------
+def save_shared_prices(prices, folder):
+    """
+    Write a PriceMatrix as a raw .npy array plus a JSON index of dates and tickers.
+    Its daily closes are shared as a price store: the one they are already
+    mapped from, or one written into `folder`.
+    """
+    np.save(os.path.join(folder, "prices.npy"), prices.prices.to_numpy(dtype=float))
+    daily = None
+    if prices.days is not None:
+        daily = prices.days.path or save_store(prices.days, os.path.join(folder, "daily"))
+    with open(os.path.join(folder, "prices_index.json"), "w") as f:
+        json.dump({
+            'dates': [d.strftime("%Y-%m-%d") for d in prices.prices.index],
+            'tickers': list(prices.prices.columns),
+            'daily': daily
+        }, f)
+    return folder
+
+
+def load_shared_prices(folder):
+    """
+    Memory-map a matrix written by save_shared_prices; all processes share the OS page cache copy.
+    """
+    values = np.load(os.path.join(folder, "prices.npy"), mmap_mode='r')
+    with open(os.path.join(folder, "prices_index.json")) as f:
+        index = json.load(f)
+    prices = pd.DataFrame(values, index=pd.DatetimeIndex(index['dates'], name='date'), columns=index['tickers'], copy=False)
+    return PriceMatrix(prices, open_store(index['daily']) if index.get('daily') else None)
+
+
+_worker_prices = None
+
+
+def _init_worker(shared_folder):
+    global _worker_prices
+    logging.getLogger("backtest").setLevel(logging.WARNING)
+    _worker_prices = load_shared_prices(shared_folder)
+
+
+def _run_config(config):
+    started = time.perf_counter()
+    row = dict(config)
+    try:
+        df = perturb_weights(load_allocations(config['file_path']), config['weight_noise'], config['seed'])
+        history_df, df_bought_year, _, reports_by_year = simulate_portfolio(
+            df,
+            config['initial_capital'],
+            provider=_worker_prices,
+            method=config['method'],
+            rebalance_offset_days=config['rebalance_offset_days'],
+            schedule=config['schedule']
+        )
+        metrics = run_metrics(history_df, None, reports_by_year, plots=False, df_bought_year=df_bought_year)
+        metrics.pop('saved_files')
+        metrics.pop('Yearly CAGR %')
+        row.update(metrics)
+        row['Final Capital'] = float(history_df['Capital End'].iloc[-1])
+        row['status'] = 'ok'
+    except Exception as e:
+        row['status'] = f"failed: {e}"
+    row['seconds'] = round(time.perf_counter() - started, 4)
+    return row
+
+
+# -----------------------------
+# Sweep runner
+# -----------------------------
+def run_sweep(configs, provider=None, max_workers=None):
+    """
+    Run simulate_portfolio + run_metrics (no plots) for every config across a process pool.
+    All prices the grid needs are fetched once up front and shared with the
+    workers as memory-mapped files (rebalance-date prices and the daily price
+    store), so they map one copy. Returns one summary row per config.
+    """
+    frames = {path: load_allocations(path) for path in {c['file_path'] for c in configs}}
+
+    needs = {}
+    for config in configs:
+        df_all, _, end_dates = prepare_allocations(frames[config['file_path']], config['rebalance_offset_days'], config['schedule'])
+        for date, tickers in price_needs(df_all, end_dates).items():
+            needs.setdefault(date, set()).update(tickers)
+    prices = PriceMatrix.build(needs, provider)
+
+    started = time.perf_counter()
+    rows = []
+    with tempfile.TemporaryDirectory() as shared_folder:
+        save_shared_prices(prices, shared_folder)
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(shared_folder,)) as pool:
+            futures = [pool.submit(_run_config, c) for c in configs]
+            for future in as_completed(futures):
+                rows.append(future.result())
+
+    summary = pd.DataFrame(rows).sort_values('name').reset_index(drop=True)
+    elapsed = time.perf_counter() - started
+    failed = int((summary['status'] != 'ok').sum())
+    logger.info(f"Sweep finished: {len(configs)} runs in {elapsed:.2f}s ({len(configs) / elapsed:.1f} runs/s), {failed} failed")
+    return summary
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of backtests.")
+    parser.add_argument("grid", help="JSON file with 'base' config and 'grid' of parameter lists")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--prices", default=None, help="Local price file instead of Yahoo Finance")
+    parser.add_argument("--out", default="sweep_summary.csv", help="Summary table output path")
+    args = parser.parse_args(argv)
+
+    with open(args.grid) as f:
+        spec = json.load(f)
+    configs = expand_grid(spec.get('base', {}), spec.get('grid', {}))
+    provider = LocalPriceProvider(args.prices) if args.prices else None
+
+    summary = run_sweep(configs, provider=provider, max_workers=args.workers)
+    summary.to_csv(args.out, index=False)
+    logger.info(f"Sweep summary saved to: {args.out}")
+    return 0 if (summary['status'] == 'ok').all() else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
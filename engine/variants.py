@@ -0,0 +1,177 @@
+# backtest/engine/variants.py
+
+import numpy as np
+import pandas as pd
+from engine.logger import logger
+from engine.prices import PriceMatrix
+from engine.profiler import profiled
+from engine.resample import path_metrics
+from engine.simulate import prepare_allocations, price_needs
+from engine.vectorized import period_arrays, simulate_arrays
+
+# Built-in weight schemes; "capped:<cap>" caps every name at <cap> (default 0.1)
+WEIGHT_SCHEMES = ("given", "equal", "capped")
+DEFAULT_CAP = 0.1
+
+COMPARISON_COLUMNS = ['Final Capital', 'Overall Portfolio Growth %', 'Max Drawdown %', 'Sharpe Ratio']
+
+
+# -----------------------------
+# Weight schemes
+# -----------------------------
+def equal_weights(df_all):
+    """
+    1 / (names in the period) for every allocation row.
+    """
+    return 1.0 / df_all.groupby('year')['ticker'].transform('size').to_numpy(dtype=float)
+
+
+def capped_weights(df_all, cap=DEFAULT_CAP, base=None):
+    """
+    `base` weights (default: the given ones) normalized per period, with every
+    name capped at `cap` and the excess spread pro rata over the uncapped names.
+    """
+    groups = df_all['year'].to_numpy()
+    weights = np.asarray(df_all['weight'] if base is None else base, dtype=float)
+    weights = weights / pd.Series(weights).groupby(groups).transform('sum').to_numpy()
+
+    sizes = pd.Series(groups).groupby(groups).transform('size').to_numpy()
+    if (cap * sizes < 1 - 1e-12).any():
+        raise ValueError(f"A cap of {cap} is infeasible for periods with fewer than {int(np.ceil(1 / cap))} names")
+
+    capped = np.zeros(len(weights), dtype=bool)
+    for _ in range(int(sizes.max(initial=0))):
+        over = weights > cap + 1e-12
+        if not over.any():
+            break
+        capped |= over
+        excess = pd.Series(np.where(over, weights - cap, 0.0)).groupby(groups).transform('sum').to_numpy()
+        weights = np.where(over, cap, weights)
+        free = pd.Series(np.where(capped, 0.0, weights)).groupby(groups).transform('sum').to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(capped, weights, weights + excess * weights / free)
+    return weights
+
+
+def variant_weights(df_all, spec):
+    """
+    Weights of one variant for every allocation row. `spec` is a scheme name
+    ("given", "equal", "capped" or "capped:<cap>"), a callable taking the
+    allocation frame, a frame of (ticker, date, weight) rows such as a
+    benchmark weighting (names it does not list are not held), a Series
+    aligned on the allocation rows' index, or an array in row order.
+    """
+    if isinstance(spec, str):
+        scheme, _, arg = spec.partition(":")
+        if scheme == "given":
+            return df_all['weight'].to_numpy(dtype=float)
+        if scheme == "equal":
+            return equal_weights(df_all)
+        if scheme == "capped":
+            return capped_weights(df_all, float(arg) if arg else DEFAULT_CAP)
+        raise ValueError(f"Unknown weight scheme: {spec} (expected one of {WEIGHT_SCHEMES})")
+
+    if callable(spec):
+        spec = spec(df_all)
+    if isinstance(spec, pd.DataFrame):
+        other = spec.assign(date=pd.to_datetime(spec['date']).dt.normalize())
+        keys = pd.MultiIndex.from_arrays([df_all['ticker'].astype(str), df_all['date'].dt.normalize()])
+        weights = other.set_index([other['ticker'].astype(str), 'date'])['weight']
+        return weights[~weights.index.duplicated(keep='last')].reindex(keys).to_numpy(dtype=float)
+    if isinstance(spec, pd.Series):
+        return spec.reindex(df_all.index).to_numpy(dtype=float)
+
+    weights = np.asarray(spec, dtype=float)
+    if weights.shape != (len(df_all),):
+        raise ValueError(f"Weight array has shape {weights.shape}, expected ({len(df_all)},)")
+    return weights
+
+
+# -----------------------------
+# Portfolio tensor
+# -----------------------------
+class PortfolioTensor:
+    """
+    Allocation rows scattered onto (periods x tickers) price arrays once, with
+    prices fetched once. `simulate` then runs any number of weight variants as
+    one (K x periods x tickers) array operation, so a variant costs array work
+    only, not a run of its own.
+    """
+
+    def __init__(self, df_all, initial_capital, provider=None, schedule=None, rebalance_offset_days=0, prices=None):
+        required_cols = ['ticker', 'date', 'weight']
+        if not all(col in df_all.columns for col in required_cols):
+            raise ValueError(f"File must contain columns: {required_cols}")
+
+        self.initial_capital = float(initial_capital)
+        self.df_all, years, self.end_dates = prepare_allocations(df_all, rebalance_offset_days, schedule)
+        self.years = list(years)
+        self.prices = prices if prices is not None else PriceMatrix.build(price_needs(self.df_all, self.end_dates), provider)
+        self.period, self.codes, self.symbols, self.start_prices, self.end_prices = period_arrays(
+            self.df_all, self.years, self.prices, self.end_dates
+        )
+        self._schemes = {}
+
+    def row_weights(self, spec):
+        """
+        Weights of one variant in row order (see variant_weights); named schemes are computed once.
+        """
+        if not isinstance(spec, str):
+            return variant_weights(self.df_all, spec)
+        if spec not in self._schemes:
+            self._schemes[spec] = variant_weights(self.df_all, spec)
+        return self._schemes[spec]
+
+    def weight_tensor(self, variants):
+        """
+        (K x periods x tickers) weights of the variants ({name: spec}),
+        normalized to sum to 1 over the names each variant holds in a period.
+        """
+        weights = np.full((len(variants), *self.start_prices.shape), np.nan)
+        for k, spec in enumerate(variants.values()):
+            weights[k, self.period, self.codes] = self.row_weights(spec)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return weights / np.nansum(weights, axis=-1, keepdims=True)
+
+    @profiled("variants")
+    def simulate(self, variants, histories=True):
+        """
+        Simulate every variant ({name: spec}) over the shared prices.
+        histories=False skips building the per-variant frames (most of the
+        cost once K runs into the thousands) and returns None for them.
+
+        Returns:
+            histories: {name: history_df} (Year, Capital Start, Capital End)
+            comparison: one row per variant with COMPARISON_COLUMNS
+        """
+        names = list(variants)
+        _, capital_start, capital_end = simulate_arrays(
+            self.weight_tensor(variants), self.start_prices, self.end_prices, self.initial_capital
+        )
+
+        if histories:
+            histories = {
+                name: pd.DataFrame({'Year': self.years, 'Capital Start': capital_start[k], 'Capital End': capital_end[k]})
+                for k, name in enumerate(names)
+            }
+        else:
+            histories = None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth, max_drawdown, sharpe = path_metrics(capital_end / capital_start - 1.0)
+        comparison = pd.DataFrame({
+            'Final Capital': capital_end[:, -1],
+            'Overall Portfolio Growth %': growth,
+            'Max Drawdown %': max_drawdown,
+            'Sharpe Ratio': sharpe
+        }, index=pd.Index(names, name='variant'))
+
+        logger.info("Simulated %d weight variants over %d periods x %d tickers", len(names), len(self.years), len(self.symbols))
+        return histories, comparison
+
+
+def simulate_variants(df_all, variants, initial_capital, provider=None, schedule=None, rebalance_offset_days=0):
+    """
+    Build a PortfolioTensor for the allocation frame and simulate the variants
+    ({name: spec}) on it. Returns ({name: history_df}, comparison).
+    """
+    return PortfolioTensor(df_all, initial_capital, provider, schedule, rebalance_offset_days).simulate(variants)
@@ -0,0 +1,112 @@
+# backtest/engine/vectorized.py
+
+import numpy as np
+import pandas as pd
+from engine.logger import logger, Amount
+from engine.prices import lookup_prices
+from engine.report import build_drift_reports, split_drift_reports
+
+# -----------------------------
+# Core array engine
+# -----------------------------
+def simulate_arrays(weights, start_prices, end_prices, initial_capital):
+    """
+    Simulate buy-and-hold periods on aligned (periods x tickers) arrays.
+    NaN weight = not held; NaN start price = not bought; NaN end price = not valued.
+    Each period's capital is the previous period's end value (capital chaining).
+    Leading axes broadcast: (K x periods x tickers) weights over the same
+    price arrays simulate K weight variants at once.
+
+    Returns:
+        shares, capital_start, capital_end
+    """
+    weights = np.asarray(weights, dtype=float)
+    start_prices = np.asarray(start_prices, dtype=float)
+    end_prices = np.asarray(end_prices, dtype=float)
+
+    bought = ~np.isnan(weights) & np.isfinite(start_prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Shares bought per unit of capital
+        units = np.where(bought, weights / start_prices, 0.0)
+        growth = np.where(bought & np.isfinite(end_prices), units * end_prices, 0.0).sum(axis=-1)
+
+    capital_end = initial_capital * np.cumprod(growth, axis=-1)
+    capital_start = np.concatenate([np.full(growth.shape[:-1] + (1,), float(initial_capital)), capital_end[..., :-1]], axis=-1)
+    shares = units * capital_start[..., None]
+    return shares, capital_start, capital_end
+
+
+# -----------------------------
+# Row-level inputs as (periods x tickers) arrays
+# -----------------------------
+def period_arrays(df_all, years, prices, end_dates):
+    """
+    Scatter allocation rows onto (periods x tickers) start and end price arrays.
+    Returns period and ticker code of every row, the ticker symbols, start_prices and end_prices.
+    """
+    period = np.searchsorted(np.asarray(years), df_all['year'].to_numpy())
+    codes, symbols = pd.factorize(df_all['ticker'])
+    if pd.Series(period * len(symbols) + codes).duplicated().any():
+        raise ValueError("Vectorized engine needs one row per ticker per period")
+
+    start_prices = np.full((len(years), len(symbols)), np.nan)
+    start_prices[period, codes] = lookup_prices(prices.prices, df_all['ticker'], df_all['date'])
+    end_prices = prices.prices.reindex(index=pd.DatetimeIndex(end_dates), columns=symbols).to_numpy(dtype=float)
+    return period, codes, symbols, start_prices, end_prices
+
+
+# -----------------------------
+# DataFrame wrapper matching the loop engine
+# -----------------------------
+def simulate_vectorized(df_all, years, prices, initial_capital, end_dates):
+    """
+    Run the whole backtest with `simulate_arrays` and unpack the results into
+    the same history_df, df_bought_year, capital_start_year and reports_by_year
+    the loop engine returns.
+    """
+    years = list(years)
+    period, codes, symbols, start_prices, end_prices = period_arrays(df_all, years, prices, end_dates)
+    weights = np.full(start_prices.shape, np.nan)
+    weights[period, codes] = df_all['weight'].to_numpy(dtype=float)
+
+    held = ~np.isnan(weights)
+    bought = held & np.isfinite(start_prices)
+    empty = ~bought.any(axis=1)
+    if empty.any():
+        raise RuntimeError(f"No valid assets to simulate in year {years[int(np.argmax(empty))]} after removing missing prices.")
+
+    shares, capital_start, capital_end = simulate_arrays(weights, start_prices, end_prices, initial_capital)
+
+    # -----------------------------
+    # Unpack per year (rows keep file order)
+    # -----------------------------
+    df_bought_year = {}
+    for p, year in enumerate(years):
+        in_year = (period == p) & bought[p, codes]
+        rows = df_all[in_year]
+        c = codes[in_year]
+
+        df_bought = rows[['ticker', 'date', 'weight']].reset_index(drop=True)
+        df_bought['price'] = start_prices[p, c]
+        df_bought['allocation'] = df_bought['weight'].to_numpy() * capital_start[p]
+        df_bought['shares'] = shares[p, c]
+        df_bought['weight'] = df_bought['weight'] / df_bought['weight'].sum()
+        df_bought_year[year] = df_bought
+
+        logger.info("Year %s: %d assets bought, capital %s -> %s", year, len(df_bought), Amount(capital_start[p]), Amount(capital_end[p]))
+
+    end_frame = pd.DataFrame(end_prices, index=years, columns=symbols)
+    reports_by_year = split_drift_reports(build_drift_reports(
+        df_bought_year,
+        dict(zip(years, capital_start)),
+        end_frame,
+        df_all[['year', 'ticker']]
+    ))
+
+    history_df = pd.DataFrame({
+        'Year': years,
+        'Capital Start': capital_start,
+        'Capital End': capital_end
+    })
+    capital_start_year = dict(zip(years, capital_start.tolist()))
+    return history_df, df_bought_year, capital_start_year, reports_by_year
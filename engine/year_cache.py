@@ -0,0 +1,137 @@
+# backtest/engine/year_cache.py
+
+import hashlib
+import os
+import pickle
+import pandas as pd
+from engine.logger import logger
+from engine.profiler import count
+
+YEAR_CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+# -----------------------------
+# Fingerprints
+# -----------------------------
+def year_fingerprint(df_year, capital, date_end, prices):
+    """
+    Hash of everything one simulated year depends on: its allocation rows,
+    starting capital, rebalance end date and the prices it reads (buy dates
+    and end date for its tickers). A change upstream changes `capital`, so
+    every later year gets a new fingerprint too.
+    """
+    rows = df_year[['ticker', 'date', 'weight']].reset_index(drop=True)
+    rows['ticker'] = rows['ticker'].astype(str)
+    dates = pd.DatetimeIndex(pd.unique(rows['date'])).append(pd.DatetimeIndex([date_end]))
+    used = prices.prices.reindex(index=dates, columns=pd.unique(rows['ticker']))
+
+    h = hashlib.sha256()
+    h.update(f"v{YEAR_CACHE_VERSION}|{float(capital)!r}|{pd.Timestamp(date_end).isoformat()}".encode())
+    h.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+    h.update(pd.util.hash_pandas_object(used, index=True).to_numpy().tobytes())
+    h.update(",".join(map(str, used.columns)).encode())
+    return h.hexdigest()
+
+
+# -----------------------------
+# Per-year result store
+# -----------------------------
+class YearCache:
+    """
+    On-disk store of simulated years keyed by `year_fingerprint`.
+    Each entry holds that year's df_bought and ending capital.
+    Least recently used entries are evicted once the store grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if cache_dir is None:
+            from engine.price_cache import CACHE_DIR
+            cache_dir = os.path.join(CACHE_DIR, "years")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, f"{fingerprint}.pkl")
+
+    def get(self, fingerprint):
+        """
+        Return the cached (df_bought, capital_end) or None.
+        """
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            self.misses += 1
+            count("year_cache_misses")
+            return None
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except Exception as e:
+            logger.warning("Ignoring unreadable year cache entry %s: %s", path, e)
+            self.misses += 1
+            count("year_cache_misses")
+            return None
+        # The modification time doubles as the last-used time for eviction
+        os.utime(path)
+        self.hits += 1
+        count("year_cache_hits")
+        return entry['df_bought'], entry['capital_end']
+
+    def put(self, fingerprint, df_bought, capital_end):
+        # Write then rename so a crashed run never leaves a partial entry
+        path = self._path(fingerprint)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({'df_bought': df_bought, 'capital_end': float(capital_end)}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        # (last used, size, path) of every entry, oldest first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pkl"):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(self.cache_dir, name)))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        """
+        Drop least recently used entries until the store holds at most `max_bytes`.
+        """
+        max_bytes = max_bytes or self.max_bytes
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info("Year cache evicted %d entries to stay under %d bytes", evicted, max_bytes)
+        return evicted
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'path': self.cache_dir,
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
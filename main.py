@@ -1,24 +1,49 @@
 # backtest/main.py
 
 import os
+import sys
+import json
 import shutil
-import numpy as np
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
+import argparse
+from contextlib import nullcontext
 
-from engine.logger import info, warning, error, setup_logger
-from engine.data_loader import preprocess_file, save_clean_csv
-from engine.simulate import simulate_from_file
-from engine.metrics import run_metrics
+# pandas, rich and the engine stages are imported where they are used,
+# so `--help` and argument errors return without loading them
+from engine.logger import info, warning, error
 
-console = Console()
-logger = setup_logger()
+JOB_KEYS = ("session", "file", "ticker_col", "weight_col", "date_col", "capital")
+
+_console = None
+
+
+def get_console():
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 
 # -----------------------------
 # Session Management
 # -----------------------------
+def new_session(session_name, base_dir="Sessions"):
+    """
+    Create Sessions/<session_name> with its raw_data, processed_data and results folders.
+    Raises FileExistsError if the session already exists.
+    """
+    session_path = os.path.join(base_dir, session_name)
+    if os.path.exists(session_path):
+        raise FileExistsError(f"Session folder already exists: {session_path}")
+
+    os.makedirs(session_path)
+    os.makedirs(os.path.join(session_path, "raw_data"))
+    os.makedirs(os.path.join(session_path, "processed_data"))
+    os.makedirs(os.path.join(session_path, "results"))
+    info(f"Session created: {session_path}")
+    return session_path
+
+
 def create_session_folder(base_dir="Sessions"):
     os.makedirs(base_dir, exist_ok=True)
 
@@ -28,38 +53,306 @@ def create_session_folder(base_dir="Sessions"):
             warning("Session name cannot be empty.")
             continue
 
-        session_path = os.path.join(base_dir, session_name)
-        if os.path.exists(session_path):
+        try:
+            return new_session(session_name, base_dir)
+        except FileExistsError:
             warning("Session folder already exists. Please choose a different name.")
+
+
+# -----------------------------
+# Pipeline stages
+# -----------------------------
+def preprocess_into_session(session_path, file_path, ticker_col, weight_col, date_col, **preprocess_kwargs):
+    """
+    Copy the raw file into the session, preprocess it and save the clean frame.
+    Returns the clean frame, which is passed on in memory.
+    """
+    from engine.data_loader import preprocess_file
+    from engine.session import save_session
+
+    raw_data_path = os.path.join(session_path, "raw_data", os.path.basename(file_path))
+    shutil.copy(file_path, raw_data_path)
+    info(f"Raw data copied to session: {raw_data_path}")
+
+    df_clean = preprocess_file(
+        file_path=raw_data_path,
+        ticker_col=ticker_col,
+        weight_col=weight_col,
+        date_col=date_col,
+        **preprocess_kwargs
+    )
+    save_session(session_path, df_clean=df_clean)
+    info(f"Data loaded and cleaned ({len(df_clean)} rows).")
+    return df_clean
+
+
+def print_reports(reports_by_year, session_path, top=None, page=1, report_format=None, quiet=False):
+    """
+    Write the drift reports as `report_format` files too, if given (they are
+    always in the session store), and, unless quiet, print each period's largest
+    weight drifts: `top` holdings per table (0 for all), page `page` of them.
+    """
+    from engine.report_output import DEFAULT_TOP, export_reports, render_reports
+
+    if report_format:
+        export_reports(reports_by_year, os.path.join(session_path, "results"), report_format)
+    if not quiet:
+        render_reports(reports_by_year, get_console(), DEFAULT_TOP if top is None else top, page)
+
+
+def print_metrics(metrics_dict):
+    from rich.panel import Panel
+
+    console = get_console()
+    console.print(Panel.fit("[bold green]Metrics Summary[/bold green]"))
+    for key, value in metrics_dict.items():
+        if key == "saved_files":
+            continue  # skip printing file paths
+        console.print(f"[cyan]{key}:[/cyan] {value}")
+
+
+def run_backtest(session_path, df_clean, initial_capital, provider=None, method="loop", plots=True, schedule=None,
+                 top=None, page=1, report_format=None, quiet=False):
+    """
+    Simulate the clean frame, save session artifacts and run metrics.
+    `schedule` is a rebalance schedule name or list of rebalance dates (yearly by default).
+    `top`, `page` and `report_format` shape the drift report output (see print_reports);
+    quiet prints no tables.
+    """
+    from engine.simulate import simulate_portfolio
+    from engine.session import save_session
+    from engine.metrics import run_metrics
+
+    history_df, df_bought_year, capital_start_year, reports_by_year, nav_df = simulate_portfolio(
+        df_clean,
+        initial_capital,
+        provider=provider,
+        method=method,
+        daily_nav=True,
+        year_cache=method == "loop",
+        schedule=schedule
+    )
+    save_session(
+        session_path,
+        history_df=history_df,
+        df_bought_year=df_bought_year,
+        reports_by_year=reports_by_year,
+        nav_df=nav_df
+    )
+    info("Simulation complete!")
+    print_reports(reports_by_year, session_path, top, page, report_format, quiet)
+
+    metrics_dict = run_metrics(history_df, session_path, reports_by_year, nav_df, plots=plots, df_bought_year=df_bought_year)
+    if not quiet:
+        print_metrics(metrics_dict)
+    info("Metrics calculated and all plots saved in results folder.")
+    return metrics_dict
+
+
+def report_profile(profiler, session_path, quiet=False):
+    """
+    Save the profile trace to results/profile.json and print its summary table (unless quiet).
+    """
+    path = profiler.write_trace(os.path.join(session_path, "results", "profile.json"))
+    if not quiet:
+        get_console().print(profiler.summary_table())
+    return path
+
+
+# -----------------------------
+# Headless batch mode
+# -----------------------------
+def load_manifest(path):
+    """
+    Read a YAML or JSON manifest: optional `defaults` merged into every entry of `jobs`.
+    """
+    with open(path) as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML manifests need PyYAML (pip install pyyaml); use JSON otherwise.")
+            spec = yaml.safe_load(f)
         else:
-            os.makedirs(session_path)
-            os.makedirs(os.path.join(session_path, "raw_data"))
-            os.makedirs(os.path.join(session_path, "processed_data"))
-            os.makedirs(os.path.join(session_path, "results"))
-            info(f"Session created: {session_path}")
-            return session_path
+            spec = json.load(f)
+
+    defaults = spec.get("defaults", {})
+    return [{**defaults, **job} for job in spec.get("jobs", [])]
+
+
+def run_job(job, base_dir="Sessions", provider=None):
+    """
+    Run one job end to end in its own session folder without prompting.
+    """
+    missing = [k for k in JOB_KEYS if k not in job]
+    if missing:
+        raise ValueError(f"Job is missing keys: {missing}")
+    if not os.path.exists(job["file"]):
+        raise FileNotFoundError(f"File not found: {job['file']}")
+
+    from engine.profiler import Profiler
+
+    os.makedirs(base_dir, exist_ok=True)
+    session_path = new_session(str(job["session"]), base_dir)
+    profiler = Profiler() if job.get("profile") else None
+    try:
+        with profiler or nullcontext():
+            df_clean = preprocess_into_session(
+                session_path,
+                job["file"],
+                job["ticker_col"],
+                job["weight_col"],
+                job["date_col"],
+                skip_delisted_check=job.get("skip_delisted_check", False),
+                provider=provider,
+                listing_source=job.get("listing_source", "live")
+            )
+            return run_backtest(
+                session_path,
+                df_clean,
+                float(job["capital"]),
+                provider=provider,
+                method=job.get("method", "loop"),
+                plots=job.get("plots", True),
+                schedule=job.get("schedule"),
+                top=job.get("top"),
+                page=job.get("page", 1),
+                report_format=job.get("report_format"),
+                quiet=job.get("quiet", False)
+            )
+    finally:
+        if profiler:
+            report_profile(profiler, session_path, job.get("quiet", False))
+
+
+def run_jobs(jobs, base_dir="Sessions", provider=None, quiet=False):
+    """
+    Run jobs back to back in this process and return one status row per job.
+    A summary table is printed unless quiet.
+    """
+    statuses = []
+    for job in jobs:
+        name = job.get("session", "?")
+        info(f"Running job: {name}")
+        try:
+            metrics_dict = run_job(job, base_dir, provider)
+            statuses.append({"session": name, "status": "ok", "final_growth_%": metrics_dict['Overall Portfolio Growth %']})
+        except Exception as e:
+            error(f"Job {name} failed: {e}")
+            statuses.append({"session": name, "status": f"failed: {e}", "final_growth_%": None})
+    if quiet:
+        return statuses
+
+    from rich.table import Table
+
+    table = Table(title="Batch Summary")
+    for col in ("session", "status", "final_growth_%"):
+        table.add_column(col)
+    for s in statuses:
+        table.add_row(str(s["session"]), s["status"], "" if s["final_growth_%"] is None else f"{s['final_growth_%']:,.2f}")
+    get_console().print(table)
+    return statuses
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Portfolio backtest. Runs interactively when no job is given.")
+    parser.add_argument("--manifest", help="YAML/JSON manifest listing many jobs")
+    parser.add_argument("--session", help="Session name")
+    parser.add_argument("--file", help="Path to portfolio file (CSV/XLSX)")
+    parser.add_argument("--ticker-col", help="Column name for Ticker/Identifier")
+    parser.add_argument("--weight-col", help="Column name for Weight")
+    parser.add_argument("--date-col", help="Column name for Date")
+    parser.add_argument("--capital", type=float, help="Initial capital")
+    parser.add_argument("--base-dir", default="Sessions", help="Folder sessions are created in")
+    parser.add_argument("--prices", help="Local price file (CSV/Parquet) instead of Yahoo Finance")
+    parser.add_argument("--price-source", choices=["yfinance", "chart"], help="Yahoo upstream: yfinance or the rate-limited chart API fetcher")
+    parser.add_argument("--price-store", help="Folder of memory-mapped daily price stores (default: BACKTEST_PRICE_STORE)")
+    parser.add_argument("--method", choices=["loop", "vectorized"], help="Simulation engine")
+    parser.add_argument("--schedule", choices=["yearly", "quarterly", "monthly", "next"], help="Rebalance schedule (default: yearly)")
+    parser.add_argument("--no-plots", action="store_true", help="Compute metrics without rendering plots")
+    parser.add_argument("--skip-delisted-check", action="store_true", help="Do not check tickers for delisting")
+    parser.add_argument("--listing-source", choices=["live", "store"], help="Where delisting is checked")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage timings to results/profile.json")
+    parser.add_argument("--top", type=int, help="Holdings shown per drift report, largest weight drift first (default: 20, 0 for all)")
+    parser.add_argument("--page", type=int, help="Page of --top holdings to show (default: 1)")
+    parser.add_argument("--report-format", choices=["xlsx", "csv"], help="Also write the drift reports as one workbook or a CSV per period (they are always in results/reports.feather)")
+    parser.add_argument("--quiet", action="store_true", help="Print no tables (reports are still saved)")
+    return parser.parse_args(argv)
+
+
+def run_headless(args):
+    jobs = load_manifest(args.manifest) if args.manifest else []
+    if args.file or args.session:
+        jobs.append({
+            "session": args.session,
+            "file": args.file,
+            "ticker_col": args.ticker_col,
+            "weight_col": args.weight_col,
+            "date_col": args.date_col,
+            "capital": args.capital
+        })
+        jobs[-1] = {k: v for k, v in jobs[-1].items() if v is not None}
+
+    # Flags override manifest settings
+    overrides = {
+        "method": args.method,
+        "schedule": args.schedule,
+        "listing_source": args.listing_source,
+        "plots": False if args.no_plots else None,
+        "skip_delisted_check": True if args.skip_delisted_check else None,
+        "profile": True if args.profile else None,
+        "top": args.top,
+        "page": args.page,
+        "report_format": args.report_format,
+        "quiet": True if args.quiet else None
+    }
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    jobs = [{**job, **overrides} for job in jobs]
+
+    from engine.prices import LocalPriceProvider, make_provider
+
+    if args.prices:
+        provider = LocalPriceProvider(args.prices)
+    elif args.price_source:
+        provider = make_provider(args.price_source)
+    else:
+        provider = None
+    if args.price_store:
+        from engine.price_store import set_store_dir
+        set_store_dir(args.price_store)
+    statuses = run_jobs(jobs, args.base_dir, provider, args.quiet)
+    return 0 if all(s["status"] == "ok" for s in statuses) else 1
 
 
 # -----------------------------
 # Main Function
 # -----------------------------
-def main():
+def main(profile=False):
     info("Starting Backtest CLI")
 
     # Session folder setup
     session_path = create_session_folder()
 
+    from engine.profiler import Profiler
+    profiler = Profiler() if profile else None
+    try:
+        with profiler or nullcontext():
+            run_interactive(session_path)
+    finally:
+        if profiler:
+            report_profile(profiler, session_path)
+
+
+def run_interactive(session_path):
+    """
+    Prompt for the portfolio file, columns and capital, then run the backtest.
+    """
     # Ask for portfolio file
     file_path = input("Enter path to portfolio file (CSV/XLSX): ").strip()
     if not os.path.exists(file_path):
         error(f"File not found: {file_path}")
         return
 
-    # Copy raw file to session/raw_data
-    raw_data_path = os.path.join(session_path, "raw_data", os.path.basename(file_path))
-    shutil.copy(file_path, raw_data_path)
-    info(f"Raw data copied to session: {raw_data_path}")
-
     # Ask for columns
     ticker_col = input("Enter the column name for Ticker/Identifier: ").strip()
     weight_col = input("Enter the column name for Weight: ").strip()
@@ -67,16 +360,7 @@ def main():
 
     # Preprocess
     try:
-        df_clean = preprocess_file(
-            file_path=raw_data_path,
-            ticker_col=ticker_col,
-            weight_col=weight_col,
-            date_col=date_col
-        )
-        # Save cleaned CSV
-        processed_path = os.path.join(session_path, "processed_data", "df_clean.csv")
-        save_clean_csv(df_clean, processed_path)
-        info(f"Data loaded and cleaned ({len(df_clean)} rows).")
+        df_clean = preprocess_into_session(session_path, file_path, ticker_col, weight_col, date_col)
     except Exception as e:
         error(f"Failed to load or preprocess file: {e}")
         return
@@ -89,57 +373,18 @@ def main():
         except ValueError:
             warning("Invalid input. Please enter a numeric value.")
 
-    # Run simulation
+    # Run simulation and metrics
     try:
-        history_df, df_bought_year, capital_start_year, reports_by_year = simulate_from_file(
-            file_path=processed_path,
-            initial_capital=initial_capital
-        )
-        info("Simulation complete!")
-
-        # -----------------------------
-        # Print yearly portfolio drift reports
-        from rich import box
-
-        for year, report in reports_by_year.items():
-            table = Table(
-                title=f"Portfolio Drift Report — Year {year}",
-                show_lines=True,
-                box=box.SIMPLE_HEAVY
-            )
-            for col in report.columns:
-                table.add_column(col, justify="right" if np.issubdtype(report[col].dtype, np.number) else "left")
-            for _, row in report.iterrows():
-                table.add_row(*[f"{v:,.2f}" if isinstance(v, (float,int)) else str(v) for v in row])
-            console.print(table)
-
-            # Save report CSV
-            report.to_csv(os.path.join(session_path, "results", f"report_{year}.csv"), index=False)
-
-    except Exception as e:
-        error(f"Simulation failed: {e}")
-        return
-
-    # -----------------------------
-    # Run metrics (plots saved silently)
-    try:
-        metrics_dict = run_metrics(history_df, session_path, reports_by_year)
-
-        # Optional: print summary metrics in CLI
-        console.print(Panel.fit("[bold green]Metrics Summary[/bold green]"))
-        for key, value in metrics_dict.items():
-            if key == "saved_files":
-                continue  # skip printing file paths
-            console.print(f"[cyan]{key}:[/cyan] {value}")
-
-        info("Metrics calculated and all plots saved in results folder.")
-
+        run_backtest(session_path, df_clean, initial_capital)
     except Exception as e:
-        error(f"Metrics calculation failed: {e}")
+        error(f"Backtest failed: {e}")
         return
 
     info("Backtest finished successfully!")
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.manifest or args.file or args.session:
+        sys.exit(run_headless(args))
+    main(profile=args.profile)
@@ -0,0 +1,25 @@
+# backtest/tests/conftest.py
+
+import os
+import pytest
+import engine.logger
+import engine.price_cache
+
+
+@pytest.fixture(autouse=True, scope="session")
+def scratch_log_dir(tmp_path_factory):
+    # The log file is opened by the first record of the session, so one folder serves every test
+    log_dir = str(tmp_path_factory.mktemp("logs"))
+    os.environ["BACKTEST_LOG_DIR"] = log_dir
+    engine.logger.LOG_DIR = log_dir
+    engine.logger.LOG_FILE = os.path.join(log_dir, "backtest.log")
+    return log_dir
+
+
+@pytest.fixture(autouse=True)
+def scratch_cache_dir(tmp_path, monkeypatch):
+    # Price, ingest and year caches of each test live in its own tmp_path, never in the repository
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setenv("BACKTEST_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(engine.price_cache, "CACHE_DIR", cache_dir)
+    return cache_dir
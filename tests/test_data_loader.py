@@ -0,0 +1,49 @@
+# backtest/tests/test_data_loader.py
+
+import pandas as pd
+from engine.data_loader import remove_delisted_tickers
+from engine.price_cache import PriceCache
+from engine.prices import PriceFetchError, PriceProvider
+
+
+class OutageProvider(PriceProvider):
+    """
+    Recent closes for `listed`; the first `outages` calls fail for every ticker but `healthy`.
+    """
+
+    def __init__(self, listed, healthy=(), outages=1):
+        self.listed = listed
+        self.healthy = healthy
+        self.outages = outages
+        self.calls = 0
+
+    def get_history(self, tickers, start, end):
+        self.calls += 1
+        days = pd.bdate_range(start, end)
+        closes = pd.DataFrame({t: 1.0 if t in self.listed else float('nan') for t in tickers}, index=days)
+        if self.calls <= self.outages:
+            failed = [t for t in tickers if t not in self.healthy]
+            closes[failed] = float('nan')
+            raise PriceFetchError(f"{len(failed)} tickers failed (outage)", closes, failed)
+        return closes
+
+
+def _allocations(tickers):
+    return pd.DataFrame({'ticker': tickers, 'date': pd.Timestamp("2020-07-01"), 'weight': 1.0 / len(tickers)})
+
+
+def test_listing_outage_is_not_cached_as_delisted(tmp_path):
+    cache = PriceCache(str(tmp_path))
+    upstream = OutageProvider(listed={'AAA', 'BBB'}, healthy={'AAA', 'GONE'})
+    df = _allocations(['AAA', 'BBB', 'GONE'])
+
+    # BBB failed: kept, and not cached; GONE answered with no closes: removed
+    kept = remove_delisted_tickers(df, provider=upstream, cache=cache)
+    assert sorted(kept['ticker']) == ['AAA', 'BBB']
+    assert cache.get_listing(['AAA', 'BBB', 'GONE'], 3600) == {'AAA': True, 'GONE': False}
+
+    # Only BBB goes back upstream
+    kept = remove_delisted_tickers(df, provider=upstream, cache=cache)
+    assert sorted(kept['ticker']) == ['AAA', 'BBB']
+    assert upstream.calls == 2
+    assert cache.get_listing(['BBB'], 3600) == {'BBB': True}
@@ -0,0 +1,87 @@
+# backtest/tests/test_fetcher.py
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from benchmarks.stub_server import StubServer
+from engine.fetcher import AsyncFetcher, YahooChartPriceProvider
+from engine.price_cache import CachedPriceProvider, PriceCache
+from engine.prices import PriceFetchError
+
+START, END = "2021-01-04", "2021-02-01"
+TICKERS = [f"T{i:05d}" for i in range(12)]
+
+
+@pytest.fixture
+def serve():
+    servers, fetchers = [], []
+
+    def start(max_in_flight=4, **server_kwargs):
+        server = StubServer(("127.0.0.1", 0), **server_kwargs).start()
+        fetcher = AsyncFetcher(base_url=server.url, max_in_flight=max_in_flight, rate=1000, backoff_base=0.001, max_retries=8)
+        servers.append(server)
+        fetchers.append(fetcher)
+        return server, fetcher
+
+    yield start
+    for fetcher in fetchers:
+        fetcher.close()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_connections_are_reused(serve):
+    server, fetcher = serve(max_in_flight=4)
+    provider = YahooChartPriceProvider(fetcher)
+
+    closes = provider.get_history(TICKERS, START, END)
+    assert closes.notna().all().all()
+    assert server.counts['requests'] == len(TICKERS)
+    assert server.counts['connections'] <= 4
+
+    opened = server.counts['connections']
+    provider.get_history(TICKERS, START, END)
+    assert server.counts['requests'] == 2 * len(TICKERS)
+    assert server.counts['connections'] == opened
+
+
+def test_throttled_requests_are_retried(serve):
+    server, fetcher = serve(fail_rate=0.3, seed=7)
+
+    closes = YahooChartPriceProvider(fetcher).get_history(TICKERS, START, END)
+
+    assert closes.notna().all().all()
+    assert server.counts['throttled'] > 0
+    assert fetcher.stats['retries'] == server.counts['throttled']
+    assert fetcher.stats['failures'] == 0
+
+
+def test_failed_tickers_are_summarized(serve):
+    server, fetcher = serve(failing=['BAD1', 'BAD2'], unknown=['GONE'])
+
+    with pytest.raises(PriceFetchError) as info:
+        YahooChartPriceProvider(fetcher).get_history(['T00001', 'BAD1', 'GONE', 'BAD2'], START, END)
+
+    error = info.value
+    assert error.failed == ['BAD1', 'BAD2']
+    assert str(error).startswith("2 tickers failed")
+    assert error.closes['T00001'].notna().all()
+    assert error.closes['GONE'].isna().all()
+    assert fetcher.stats['failures'] == 2
+
+
+def test_failed_tickers_are_fetched_again(serve, tmp_path):
+    server, fetcher = serve(failing=['BAD1'])
+    provider = CachedPriceProvider(YahooChartPriceProvider(fetcher), PriceCache(str(tmp_path)))
+
+    with pytest.raises(PriceFetchError):
+        provider.get_history(['T00001', 'BAD1'], START, END)
+    requests = server.counts['requests']
+    with pytest.raises(PriceFetchError) as info:
+        provider.get_history(['T00001', 'BAD1'], START, END)
+    assert info.value.failed == ['BAD1']
+
+    # Only BAD1 goes back to the server, with its full retry budget
+    assert server.counts['requests'] - requests == fetcher.max_retries + 1
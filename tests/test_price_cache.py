@@ -0,0 +1,93 @@
+# backtest/tests/test_price_cache.py
+
+import pandas as pd
+import pytest
+from engine.price_cache import CachedPriceProvider, PriceCache
+from engine.prices import PriceFetchError, PriceProvider
+
+
+class FlakyProvider(PriceProvider):
+    """
+    Upstream returning an empty frame for the first `empty_calls` calls, then real closes.
+    """
+
+    def __init__(self, closes, empty_calls=1):
+        self.closes = closes
+        self.empty_calls = empty_calls
+        self.calls = 0
+
+    def get_history(self, tickers, start, end):
+        self.calls += 1
+        if self.calls <= self.empty_calls:
+            return pd.DataFrame(columns=list(tickers), dtype=float)
+        window = self.closes[(self.closes.index >= pd.Timestamp(start)) & (self.closes.index < pd.Timestamp(end))]
+        return window.reindex(columns=list(tickers))
+
+
+def _closes():
+    days = pd.bdate_range("2021-01-04", "2021-01-29")
+    return pd.DataFrame({'AAA': range(1, len(days) + 1), 'BBB': range(101, len(days) + 101)}, index=days, dtype=float)
+
+
+def test_empty_upstream_response_is_refetched(tmp_path):
+    upstream = FlakyProvider(_closes())
+    provider = CachedPriceProvider(upstream, PriceCache(str(tmp_path)))
+
+    with pytest.raises(PriceFetchError) as info:
+        provider.get_history(['AAA', 'BBB'], "2021-01-04", "2021-01-16")
+    assert info.value.failed == ['AAA', 'BBB']
+    assert info.value.closes.dropna(how='all').empty
+
+    second = provider.get_history(['AAA', 'BBB'], "2021-01-04", "2021-01-16")
+    assert upstream.calls == 2
+    assert second.loc["2021-01-04", 'AAA'] == 1.0
+    assert len(second) == 10
+
+    provider.get_history(['AAA', 'BBB'], "2021-01-04", "2021-01-16")
+    assert upstream.calls == 2
+
+
+def test_ticker_without_closes_is_covered_when_others_arrived(tmp_path):
+    upstream = FlakyProvider(_closes(), empty_calls=0)
+    provider = CachedPriceProvider(upstream, PriceCache(str(tmp_path)))
+
+    provider.get_history(['AAA', 'GONE'], "2021-01-04", "2021-01-16")
+    provider.get_history(['GONE'], "2021-01-04", "2021-01-16")
+    assert upstream.calls == 1
+
+
+def test_failed_tickers_stay_uncovered(tmp_path):
+    class PartialProvider(FlakyProvider):
+        def get_history(self, tickers, start, end):
+            closes = super().get_history(tickers, start, end)
+            if self.calls == 1:
+                raise PriceFetchError("1 tickers failed", closes.drop(columns=['BBB']), ['BBB'])
+            return closes
+
+    upstream = PartialProvider(_closes(), empty_calls=0)
+    provider = CachedPriceProvider(upstream, PriceCache(str(tmp_path)))
+
+    # The failure reaches the caller together with what was cached
+    with pytest.raises(PriceFetchError) as info:
+        provider.get_history(['AAA', 'BBB'], "2021-01-04", "2021-01-16")
+    assert info.value.failed == ['BBB']
+    assert info.value.closes['AAA'].notna().all()
+    assert info.value.closes['BBB'].isna().all()
+
+    closes = provider.get_history(['AAA', 'BBB'], "2021-01-04", "2021-01-16")
+    assert upstream.calls == 2
+    assert closes['BBB'].notna().all()
+
+
+def test_upstream_exception_is_reported_as_fetch_error(tmp_path):
+    class DownProvider(FlakyProvider):
+        def get_history(self, tickers, start, end):
+            self.calls += 1
+            raise ConnectionError("upstream down")
+
+    provider = CachedPriceProvider(DownProvider(_closes()), PriceCache(str(tmp_path)))
+
+    with pytest.raises(PriceFetchError, match="upstream down") as info:
+        provider.get_history(['AAA'], "2021-01-04", "2021-01-16")
+    assert info.value.failed == ['AAA']
+    assert provider.cache.missing_ranges(['AAA'], "2021-01-04", "2021-01-16")
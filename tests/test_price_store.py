@@ -0,0 +1,63 @@
+# backtest/tests/test_price_store.py
+
+import os
+import numpy as np
+import pandas as pd
+from engine.price_store import INDEX_FILE, load_days
+from engine.prices import PriceFetchError, PriceProvider
+
+START, END = "2021-01-04", "2021-02-01"
+
+
+class OutageProvider(PriceProvider):
+    """
+    Daily closes of 1.0; the first `outages` calls fail for `down`.
+    """
+
+    def __init__(self, down=(), outages=1):
+        self.down = down
+        self.outages = outages
+        self.calls = 0
+
+    def get_history(self, tickers, start, end):
+        self.calls += 1
+        closes = pd.DataFrame(1.0, index=pd.bdate_range(start, end, inclusive='left'), columns=list(tickers))
+        failed = [t for t in tickers if t in self.down]
+        if failed and self.calls <= self.outages:
+            closes[failed] = np.nan
+            raise PriceFetchError(f"{len(failed)} tickers failed (outage)", closes, failed)
+        return closes
+
+    def source_id(self):
+        return "outage"
+
+
+def _stores(store_dir):
+    return [d for d in os.listdir(store_dir) if os.path.exists(os.path.join(store_dir, d, INDEX_FILE))]
+
+
+def test_store_is_reused(tmp_path):
+    provider = OutageProvider()
+
+    first = load_days(['AAA', 'BBB'], START, END, provider, str(tmp_path))
+    second = load_days(['AAA', 'BBB'], START, END, provider, str(tmp_path))
+
+    assert provider.calls == 1
+    assert first.path == second.path
+    assert np.isnan(second.values).sum() == 0
+
+
+def test_store_with_failed_tickers_is_not_published(tmp_path):
+    provider = OutageProvider(down={'BBB'})
+
+    # What did arrive is served from memory; nothing is left in the store folder
+    days = load_days(['AAA', 'BBB'], START, END, provider, str(tmp_path))
+    assert days.path is None
+    assert np.isnan(days.values[:, 0]).sum() == 0
+    assert np.isnan(days.values[:, 1]).all()
+    assert os.listdir(tmp_path) == []
+
+    days = load_days(['AAA', 'BBB'], START, END, provider, str(tmp_path))
+    assert provider.calls == 2
+    assert np.isnan(days.values).sum() == 0
+    assert len(_stores(tmp_path)) == 1
@@ -0,0 +1,125 @@
+# backtest/tests/test_simulate.py
+
+import pandas as pd
+import pytest
+from benchmarks.synthetic import SyntheticPriceProvider, make_allocations
+from engine.prices import LocalPriceProvider
+from engine.simulate import SIMULATION_METHODS, simulate_portfolio
+
+
+def _provider(**closes):
+    # Wide closes: keyword per ticker, {date: close}
+    frame = pd.DataFrame(closes)
+    frame.index = pd.to_datetime(frame.index)
+    return LocalPriceProvider(frame.sort_index().rename_axis('date').reset_index())
+
+
+def _allocations(rows):
+    df = pd.DataFrame(rows, columns=['ticker', 'date', 'weight'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+@pytest.mark.parametrize("method", SIMULATION_METHODS)
+def test_buy_price_is_first_close_on_or_after_date(method):
+    provider = _provider(
+        A={'2020-07-01': 10.0, '2021-07-01': 20.0},
+        B={'2020-07-03': 50.0, '2021-07-02': 25.0}
+    )
+    allocations = _allocations([('A', '2020-07-01', 0.5), ('B', '2020-07-01', 0.5)])
+
+    history_df, df_bought_year, _, _ = simulate_portfolio(allocations, 100_000, provider=provider, method=method)
+
+    bought = df_bought_year[2020].set_index('ticker')
+    assert bought.loc['A', 'price'] == 10.0
+    assert bought.loc['B', 'price'] == 50.0
+    # Rebalance on 2021-07-01 reads B's close of the next day
+    assert history_df['Capital End'].iloc[0] == pytest.approx(5000 * 20.0 + 1000 * 25.0)
+
+
+@pytest.mark.parametrize("method", SIMULATION_METHODS)
+def test_lookup_window_edges(method):
+    # ON_OR_AFTER_WINDOW_DAYS is 7: a close 6 days later is used, one 7 days later is not
+    provider = _provider(
+        A={'2020-07-07': 10.0, '2021-07-01': 10.0},
+        B={'2020-07-08': 10.0, '2021-07-01': 10.0},
+        C={'2020-07-01': 10.0, '2021-07-01': 10.0}
+    )
+    allocations = _allocations([('A', '2020-07-01', 0.4), ('B', '2020-07-01', 0.2), ('C', '2020-07-01', 0.4)])
+
+    _, df_bought_year, _, _ = simulate_portfolio(allocations, 100_000, provider=provider, method=method)
+
+    assert sorted(df_bought_year[2020]['ticker']) == ['A', 'C']
+
+
+@pytest.mark.parametrize("method", SIMULATION_METHODS)
+def test_missing_tickers_are_dropped(method):
+    provider = _provider(
+        A={'2020-07-01': 10.0, '2021-07-01': 20.0, '2022-07-01': 40.0},
+        B={'2020-07-01': 50.0, '2021-07-01': 25.0, '2022-07-01': 25.0},
+        C={'2020-07-01': 5.0}
+    )
+    allocations = _allocations([
+        ('A', '2020-07-01', 0.4), ('B', '2020-07-01', 0.4), ('GONE', '2020-07-01', 0.2),
+        ('A', '2021-07-01', 0.4), ('B', '2021-07-01', 0.4), ('C', '2021-07-01', 0.2)
+    ])
+
+    history_df, df_bought_year, _, _ = simulate_portfolio(allocations, 100_000, provider=provider, method=method)
+
+    # No price at all: never bought. No price at the rebalance date: not bought either.
+    assert sorted(df_bought_year[2020]['ticker']) == ['A', 'B']
+    assert sorted(df_bought_year[2021]['ticker']) == ['A', 'B']
+    assert list(history_df['Capital End']) == pytest.approx([4000 * 20.0 + 800 * 25.0, 2000 * 40.0 + 1600 * 25.0])
+
+
+def _flat_provider(tickers, price=10.0):
+    days = pd.bdate_range("2020-01-01", "2021-12-31").strftime("%Y-%m-%d")
+    return _provider(**{t: dict.fromkeys(days, price) for t in tickers})
+
+
+@pytest.mark.parametrize("method", SIMULATION_METHODS)
+@pytest.mark.parametrize("schedule", ["yearly", "quarterly", ["2020-10-01"]])
+def test_period_with_several_buy_dates_spends_its_capital_once(method, schedule):
+    # Three monthly allocations in one period: flat prices keep the capital unchanged
+    provider = _flat_provider('ABCDEF')
+    allocations = _allocations([
+        ('A', '2020-07-01', 0.5), ('B', '2020-07-01', 0.5),
+        ('C', '2020-08-03', 0.5), ('D', '2020-08-03', 0.5),
+        ('E', '2020-09-01', 0.5), ('F', '2020-09-01', 0.5)
+    ])
+
+    history_df, df_bought_year, _, _ = simulate_portfolio(allocations, 100_000, provider=provider, method=method, schedule=schedule)
+
+    assert len(history_df) == 1
+    assert history_df['Capital End'].iloc[0] == pytest.approx(100_000)
+    assert df_bought_year[history_df['Year'].iloc[0]]['allocation'].sum() == pytest.approx(100_000)
+
+
+def test_ticker_bought_on_several_dates_of_a_period():
+    provider = _flat_provider('AB')
+    allocations = _allocations([
+        (t, date, 0.5) for date in ['2020-07-01', '2020-08-03', '2020-09-01'] for t in 'AB'
+    ])
+
+    history_df, _, _, _ = simulate_portfolio(allocations, 100_000, provider=provider, method="loop", schedule="quarterly")
+    assert history_df['Capital End'].iloc[0] == pytest.approx(100_000)
+
+    with pytest.raises(ValueError, match="one row per ticker per period"):
+        simulate_portfolio(allocations, 100_000, provider=provider, method="vectorized", schedule="quarterly")
+
+
+def test_engines_agree_on_synthetic_prices():
+    provider = SyntheticPriceProvider(seed=3, delisted_fraction=0.2)
+    allocations = make_allocations(n_tickers=40, n_years=4, start_year=2012, universe_factor=3, seed=3)
+
+    loop = simulate_portfolio(allocations, 100_000, provider=provider, method="loop")
+    vectorized = simulate_portfolio(allocations, 100_000, provider=provider, method="vectorized")
+
+    pd.testing.assert_frame_equal(loop[0], vectorized[0])
+    for year in loop[1]:
+        pd.testing.assert_frame_equal(loop[1][year], vectorized[1][year])
+
+
+def test_empty_allocations_raise():
+    with pytest.raises(ValueError, match="No allocation rows"):
+        simulate_portfolio(_allocations([]), 100_000, provider=_provider(A={'2020-07-01': 1.0}))
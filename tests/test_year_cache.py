@@ -0,0 +1,34 @@
+# backtest/tests/test_year_cache.py
+
+import pandas as pd
+from benchmarks.synthetic import SyntheticPriceProvider, make_allocations
+from engine.simulate import simulate_portfolio
+from engine.year_cache import YearCache
+
+
+def test_changed_year_and_later_years_are_recomputed(tmp_path):
+    provider = SyntheticPriceProvider(seed=5)
+    allocations = make_allocations(n_tickers=20, n_years=5, start_year=2012, seed=5)
+    years = sorted(allocations['date'].dt.year.unique())
+
+    first = YearCache(str(tmp_path))
+    simulate_portfolio(allocations, 100_000, provider=provider, year_cache=first)
+    assert (first.hits, first.misses) == (0, 5)
+
+    # Move weight between two holdings of the middle year
+    changed = allocations.copy()
+    rows = changed.index[changed['date'].dt.year == years[2]][:2]
+    changed.loc[rows, 'weight'] = changed.loc[rows[::-1], 'weight'].to_numpy()
+
+    second = YearCache(str(tmp_path))
+    cached = simulate_portfolio(changed, 100_000, provider=provider, year_cache=second)
+    assert (second.hits, second.misses) == (2, 3)
+
+    fresh = simulate_portfolio(changed, 100_000, provider=provider)
+    pd.testing.assert_frame_equal(cached[0], fresh[0])
+    for year in fresh[1]:
+        pd.testing.assert_frame_equal(cached[1][year], fresh[1][year])
+
+    third = YearCache(str(tmp_path))
+    simulate_portfolio(changed, 100_000, provider=provider, year_cache=third)
+    assert (third.hits, third.misses) == (5, 0)